@@ -1,33 +1,92 @@
+import orjson
 import os
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Trino settings
-TRINO_HOST = os.getenv("TRINO_HOST", "localhost")
-TRINO_PORT = int(os.getenv("TRINO_PORT", "8080"))
-TRINO_USER = os.getenv("TRINO_USER", "trino")
-TRINO_DEFAULT_CATALOG = os.getenv("TRINO_DEFAULT_CATALOG", "your_catalog")
-TRINO_DEFAULT_SCHEMA = os.getenv("TRINO_DEFAULT_SCHEMA", "your_schema")
-
-# Ollama settings
-OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
-
-# Schema cache settings
-SCHEMA_CACHE_TTL = int(os.getenv("SCHEMA_CACHE_TTL", "3600"))  # 1 hour
-
-# Logging settings
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
-LOG_FORMAT = os.getenv("LOG_FORMAT", "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-LOG_DIR = os.getenv("LOG_DIR", "logs")
-
-# Application settings
-APP_HOST = os.getenv("APP_HOST", "0.0.0.0")
-APP_PORT = int(os.getenv("APP_PORT", "8000"))
-
-# JWT settings
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")
-JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
-JWT_ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
\ No newline at end of file
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from types import MappingProxyType
+from dotenv import dotenv_values
+
+def _env_file_stamp(path):
+    """[mtime_ns, size] of the .env file (a list, to compare equal after a JSON round trip), or None"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+@lru_cache(maxsize=1)
+def _load_env():
+    """Parse the .env file once per process (optionally via a JSON snapshot kept in step with it)"""
+    cache_path = os.environ.get("SETTINGS_CACHE_PATH")
+    stamp = _env_file_stamp(".env")
+    if cache_path:
+        try:
+            with open(cache_path, "rb") as f:
+                snapshot = orjson.loads(f.read())
+            # Only reuse the snapshot while .env is unchanged since it was taken
+            if snapshot.get("env_stamp") == stamp:
+                return MappingProxyType(snapshot["values"])
+        except (FileNotFoundError, orjson.JSONDecodeError, AttributeError, KeyError):
+            pass
+
+    values = {k: v for k, v in dotenv_values(".env").items() if v is not None}
+
+    if cache_path:
+        with open(cache_path, "wb") as f:
+            f.write(orjson.dumps({"env_stamp": stamp, "values": values}))
+    return MappingProxyType(values)
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """Application settings, resolved once from the environment"""
+    # Trino settings
+    TRINO_HOST: str = "localhost"
+    TRINO_PORT: int = 8080
+    TRINO_USER: str = "trino"
+    TRINO_DEFAULT_CATALOG: str = "your_catalog"
+    TRINO_DEFAULT_SCHEMA: str = "your_schema"
+    TRINO_POOL_SIZE: int = 8  # Connections shared by concurrent queries
+    TRINO_TARGET_RESULT_SIZE: str = "16MB"  # Result page size requested from Trino; empty keeps the server default
+
+    # Ollama settings
+    OLLAMA_API_URL: str = "http://localhost:11434/api"
+    OLLAMA_MODEL: str = "mistral"
+
+    # Schema cache settings
+    SCHEMA_CACHE_TTL: int = 3600  # 1 hour
+
+    # Logging settings
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    LOG_DIR: str = "logs"
+
+    # Application settings
+    APP_HOST: str = "0.0.0.0"
+    APP_PORT: int = 8000
+    APP_ENV: str = "development"  # "production" runs multiple workers without reload
+    # Worker processes in production; 0 means 2 * CPU count + 1. Keep this at 1 for now: conversation
+    # context, request coalescing and the token/status caches live in each process, Chroma's
+    # PersistentClient can't be shared between processes, and every worker would rotate the same log files.
+    APP_WORKERS: int = 1
+    ALLOWED_HOSTS: str = "*"  # Comma-separated Host header allowlist
+
+    # JWT settings
+    JWT_SECRET_KEY: str = "your-secret-key-here"
+    JWT_ALGORITHM: str = "HS256"
+    JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    BCRYPT_ROUNDS: int = 12  # Stored hashes are upgraded to this cost on login
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        """Build settings with a single pass over the environment"""
+        values = {}
+        for field in fields(cls):
+            raw = environ.get(field.name)
+            if raw is not None:
+                values[field.name] = field.type(raw)
+        return cls(**values)
+
+# Load environment variables from .env file without overriding the real environment
+for _key, _value in _load_env().items():
+    os.environ.setdefault(_key, _value)
+
+settings = Settings.from_env()
@@ -1,36 +1,166 @@
+import atexit
+import functools
 import logging
+import logging.handlers
+import queue
 import sys
 import os
-import json
-from datetime import datetime
+import orjson
 from pathlib import Path
+from app.config.settings import settings
 
-# Create logs directory if it doesn't exist
-logs_dir = Path("logs")
-logs_dir.mkdir(exist_ok=True)
+# Logs directory under the project root; created by init_logging()
+logs_dir = Path(__file__).resolve().parents[2] / settings.LOG_DIR
 
 # Configure logger format
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+
+# Records never use thread/process fields, so skip collecting them
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+
+class BufferedFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """Daily rotating file handler that writes through a large buffer.
+
+    The stream is not flushed after every record; it is flushed for ERROR
+    records, by flush_logs() and when the handler is closed.
+    """
+    buffer_size = 65536
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=self.buffer_size, encoding=self.encoding, errors=self.errors)
+
+    def emit(self, record):
+        super().emit(record)
+        if record.levelno >= logging.ERROR:
+            self.sync()
+
+    def flush(self):
+        # Called by StreamHandler.emit after every record; writes are batched instead
+        pass
+
+    def sync(self):
+        """Write buffered data to disk"""
+        with self.lock:
+            if self.stream:
+                self.stream.flush()
+
+def _file_handler(filename, formatter):
+    """Create a file handler that rotates daily (the file is opened on first write)"""
+    handler = BufferedFileHandler(logs_dir / filename, when="midnight", encoding="utf-8", delay=True)
+    handler.setFormatter(formatter)
+    return handler
 
 # Setup file handlers
-current_date = datetime.now().strftime("%Y-%m-%d")
-file_handler = logging.FileHandler(f"logs/app-{current_date}.log")
-file_handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+file_handler = _file_handler("app.log", formatter)
+
+auth_handler = _file_handler("auth.log", formatter)
+auth_handler.addFilter(logging.Filter("auth"))
+
+error_handler = _file_handler("error.log", formatter)
+error_handler.setLevel(logging.ERROR)
+
+# Buffer file writes; ERROR and above flush immediately so crash context is kept
+memory_handler = logging.handlers.MemoryHandler(512, flushLevel=logging.ERROR, target=file_handler)
 
 # Setup console handler
 console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+console_handler.setFormatter(formatter)
 
-# Create specialized loggers
+# Hand records to a background thread so file/console I/O stays off the event loop
+log_queue = queue.Queue(-1)
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_listener = logging.handlers.QueueListener(
+    log_queue, memory_handler, auth_handler, error_handler, console_handler,
+    respect_handler_level=True
+)
+
+# Full AI prompts/responses go to their own daily-rotated dump files
+def _dump_handler(name):
+    """Create a dump file handler that only accepts records from the named logger"""
+    handler = _file_handler(f"{name}.log", logging.Formatter("==== %(asctime)s - %(message)s\n"))
+    handler.addFilter(logging.Filter(name))
+    return handler
+
+dump_queue = queue.Queue(-1)
+prompts_handler = _dump_handler("prompts")
+responses_handler = _dump_handler("responses")
+dump_listener = logging.handlers.QueueListener(dump_queue, prompts_handler, responses_handler)
+
+_logging_started = False
+
+def init_logging():
+    """Create the logs directory and start the background log writers (runs once)"""
+    global _logging_started
+    if _logging_started:
+        return
+    logs_dir.mkdir(parents=True, exist_ok=True)
+    queue_listener.start()
+    dump_listener.start()
+    atexit.register(queue_listener.stop)
+    atexit.register(dump_listener.stop)
+    _logging_started = True
+
+def flush_logs():
+    """Flush buffered log records to disk"""
+    memory_handler.flush()
+    for handler in (file_handler, auth_handler, error_handler, prompts_handler, responses_handler):
+        handler.sync()
+
+@functools.lru_cache(maxsize=None)
 def get_logger(name):
-    """Get a logger with the specified name"""
+    """Get a logger with the specified name (handlers are attached only once)"""
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    if not logger.handlers:
+        logger.addHandler(queue_handler)
+    logger.propagate = False
     return logger
 
+# Log file backing each viewable log type; api/trino/ai records live in app.log
+LOG_FILES = {
+    "app": "app.log",
+    "api": "app.log",
+    "trino": "app.log",
+    "ai": "app.log",
+    "prompts": "prompts.log",
+    "responses": "responses.log"
+}
+
+def tail_log(log_type, lines, block_size=65536):
+    """Return the last lines of a log as bytes, reading the file backwards in blocks"""
+    path = logs_dir / LOG_FILES[log_type]
+    if lines <= 0 or not path.exists():
+        return []
+
+    # Shared app.log records are narrowed down to the requested logger name
+    marker = None
+    if LOG_FILES[log_type] == "app.log" and log_type != "app":
+        marker = f" - {log_type} - ".encode()
+
+    found = []
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0 and len(found) < lines:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            parts = (f.read(read_size) + remainder).split(b"\n")
+            # The first piece may be the tail of a line that starts in an earlier block
+            remainder = parts.pop(0) if position > 0 else b""
+            for line in reversed(parts):
+                if line and (marker is None or marker in line):
+                    found.append(line)
+                    if len(found) == lines:
+                        break
+
+    found.reverse()
+    return found
+
 # Create specialized loggers
 api_logger = get_logger("api")
 trino_logger = get_logger("trino")
@@ -38,59 +168,112 @@ ai_logger = get_logger("ai")
 schema_logger = get_logger("schema")
 error_logger = get_logger("error")
 
+prompts_logger = logging.getLogger("prompts")
+responses_logger = logging.getLogger("responses")
+for _dump_logger in (prompts_logger, responses_logger):
+    _dump_logger.setLevel(logging.INFO)
+    _dump_logger.addHandler(logging.handlers.QueueHandler(dump_queue))
+    _dump_logger.propagate = False
+
+# Raw request bodies above this size are not logged
+MAX_LOGGED_BODY_SIZE = 4096
+
 # Log structured data
 def log_api_request(route, method, params=None, body=None):
     """Log API request details"""
-    api_logger.info(f"API Request: {method} {route}")
+    if not api_logger.isEnabledFor(logging.INFO):
+        return
+    api_logger.info("API Request: %s %s", method, route)
     if params:
-        api_logger.info(f"Query params: {json.dumps(params)}")
+        if isinstance(params, bytes):
+            # Raw ASGI query string, decoded here; the INFO check above already skips this when disabled
+            api_logger.info("Query params: %s", params.decode("latin-1"))
+        else:
+            api_logger.info("Query params: %s", orjson.dumps(params).decode())
     if body:
-        api_logger.info(f"Request body: {json.dumps(body, default=str)}")
+        if isinstance(body, (bytes, bytearray)):
+            # Raw request bodies are logged as-is (no decode/re-encode round trip) when small
+            if len(body) <= MAX_LOGGED_BODY_SIZE:
+                api_logger.info("Request body: %s", body.decode("utf-8", "replace"))
+        else:
+            api_logger.info("Request body: %s", orjson.dumps(body, default=str).decode())
 
 def log_api_response(route, status_code, response_time=None):
     """Log API response details"""
-    msg = f"API Response: {route} - Status: {status_code}"
     if response_time:
-        msg += f" - Time: {response_time:.2f}s"
-    api_logger.info(msg)
+        api_logger.info("API Response: %s - Status: %s - Time: %.2fs", route, status_code, response_time)
+    else:
+        api_logger.info("API Response: %s - Status: %s", route, status_code)
 
 def log_trino_query(query, params=None):
     """Log Trino query"""
-    trino_logger.info(f"Executing Trino query: {query}")
+    if not trino_logger.isEnabledFor(logging.INFO):
+        return
+    trino_logger.info("Executing Trino query: %s", query)
     if params:
-        trino_logger.info(f"Query parameters: {json.dumps(params, default=str)}")
+        trino_logger.info("Query parameters: %s", orjson.dumps(params, default=str).decode())
 
 def log_trino_result(query, row_count, execution_time=None):
     """Log Trino query result"""
-    msg = f"Query result: {row_count} rows returned"
     if execution_time:
-        msg += f" - Execution time: {execution_time:.2f}s"
-    trino_logger.info(msg)
+        trino_logger.info("Query result: %s rows returned - Execution time: %.2fs", row_count, execution_time)
+    else:
+        trino_logger.info("Query result: %s rows returned", row_count)
 
 def log_ai_prompt(prompt_type, prompt):
     """Log AI prompt"""
-    ai_logger.info(f"AI Prompt ({prompt_type}): {prompt[:200]}...")
+    ai_logger.info("AI Prompt (%s): %.200s...", prompt_type, prompt)
     # Log full prompt to a separate file for debugging
-    with open(f"logs/prompts-{current_date}.log", "a") as f:
-        f.write(f"==== {datetime.now()} - {prompt_type} ====\n")
-        f.write(prompt)
-        f.write("\n\n")
+    prompts_logger.info("%s ====\n%s\n", prompt_type, prompt)
 
 def log_ai_response(prompt_type, response):
     """Log AI response"""
-    ai_logger.info(f"AI Response ({prompt_type}): {response[:200]}...")
+    ai_logger.info("AI Response (%s): %.200s...", prompt_type, response)
     # Log full response to a separate file for debugging
-    with open(f"logs/responses-{current_date}.log", "a") as f:
-        f.write(f"==== {datetime.now()} - {prompt_type} ====\n")
-        f.write(response)
-        f.write("\n\n")
+    responses_logger.info("%s ====\n%s\n", prompt_type, response)
 
 def log_schema_update(catalog, schema=None, tables_count=None):
     """Log schema update"""
-    schema_logger.info(f"Schema update: {catalog}.{schema if schema else '*'} - {tables_count} tables")
+    schema_logger.info("Schema update: %s.%s - %s tables", catalog, schema if schema else '*', tables_count)
 
 def log_error(module, error_message, exception=None):
     """Log error"""
-    error_logger.error(f"Error in {module}: {error_message}")
+    error_logger.error("Error in %s: %s", module, error_message)
     if exception:
-        error_logger.error(f"Exception: {str(exception)}", exc_info=True)
\ No newline at end of file
+        # The traceback comes from the exception itself and is only formatted when emitted
+        error_logger.error("Exception: %s", exception, exc_info=exception)
+
+class Logger:
+    """Category based logging used by the services"""
+    _instance = None
+
+    def __new__(cls):
+        # Every Logger() call shares one instance
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def log_info(self, category, message, *args):
+        """Log info message (args are formatted lazily, %-style)"""
+        get_logger(category).info(message, *args)
+
+    def log_error(self, category, message, error=None):
+        """Log error message"""
+        if error:
+            error_logger.error("%s - %s: %s", category, message, error)
+        else:
+            error_logger.error("%s - %s", category, message)
+
+    def log_auth(self, message, *args):
+        """Log authentication related message"""
+        get_logger("auth").info(message, *args)
+
+    def log_activity(self, user_id, action, details=None):
+        """Log user activity"""
+        if details:
+            get_logger("app").info("User %s performed %s: %s", user_id, action, details)
+        else:
+            get_logger("app").info("User %s performed %s", user_id, action)
+
+# Create global logger instance
+logger = Logger()
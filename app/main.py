@@ -1,41 +1,113 @@
-from fastapi import FastAPI, HTTPException, Request, Depends, status
+from fastapi import FastAPI, HTTPException, Request, Response, Depends, Query, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, ORJSONResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from typing import Dict, Any, Callable, Optional
+from typing import Annotated, Any, Awaitable, Callable, Dict, List, Optional
+from cachetools import TTLCache
+from contextlib import asynccontextmanager
+import asyncio
+import gzip
+import hashlib
+import os
+import secrets
+import threading
+import orjson
 import uvicorn
-import json
 import time
 from datetime import datetime
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from pydantic import BaseModel, constr, validator
+from pydantic import BaseModel, Field, StringConstraints, field_validator
 import re
+from pathlib import Path
 
-from app.config import settings
+from app.config.settings import settings
 from app.services.trino_service import TrinoService
 from app.services.schema_service import SchemaService
 from app.services.ai_service import AIService
 from app.services.error_service import ErrorService
-from app.logging.logger import log_api_request, log_api_response, log_error
+from app.logging.logger import log_api_request, log_api_response, log_error, flush_logs, tail_log, init_logging, logger, LOG_FILES
 from app.services.status_service import StatusService
 from app.services.memory_service import MemoryService
 from app.services.iam_service import IAMService
-from app.core.logging import logger
 
-app = FastAPI(title="AI Analytics Agent")
+init_logging()
+
+class FastORJSONResponse(ORJSONResponse):
+    """ORJSONResponse that also accepts non-string keys and values such as Decimal"""
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+# Services are created when the worker starts rather than at import time
+trino_service: Optional[TrinoService] = None
+schema_service: Optional[SchemaService] = None
+memory_service: Optional[MemoryService] = None
+ai_service: Optional[AIService] = None
+status_service: Optional[StatusService] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create services on startup and release their connections on shutdown"""
+    global trino_service, schema_service, memory_service, ai_service, status_service
+    # Construct the blocking clients concurrently
+    trino_service, memory_service = await asyncio.gather(
+        asyncio.to_thread(TrinoService),
+        asyncio.to_thread(MemoryService)
+    )
+    schema_service = SchemaService(trino_service)
+    ai_service = AIService(trino_service=trino_service, memory_service=memory_service)
+    status_service = StatusService(trino_service, memory_service, ai_service)
+    try:
+        yield
+    finally:
+        await ai_service.close()
+        await asyncio.to_thread(trino_service.close)
+        flush_logs()
+
+app = FastAPI(title="AI Analytics Agent", default_response_class=FastORJSONResponse, lifespan=lifespan)
+
+TEMPLATES_DIR = Path("app/templates")
+
+# Templates are compiled once per process and never re-checked on disk
+templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+templates.env.auto_reload = False
+# Compile the dashboard up front so the first visit doesn't pay for it
+templates.env.get_template("dashboard.html")
+
+# The login page has no template variables, so it is read and encoded once
+LOGIN_PAGE = (TEMPLATES_DIR / "login.html").read_bytes()
+# Compressed once at maximum level instead of by GZipMiddleware on every visit
+LOGIN_PAGE_GZIP = gzip.compress(LOGIN_PAGE, compresslevel=9)
+
+# Part of the dashboard ETag, so a new template invalidates cached pages
+DASHBOARD_DIGEST = hashlib.blake2b((TEMPLATES_DIR / "dashboard.html").read_bytes(), digest_size=8).hexdigest()
 error_service = ErrorService()
 iam_service = IAMService()
 
-# Security middleware
-app.add_middleware(
-    TrustedHostMiddleware,
-    allowed_hosts=["*"]  # In production, replace with specific hosts
-)
+# Security middleware; with the default "*" host check it would accept everything, so skip it
+if settings.ALLOWED_HOSTS != "*":
+    app.add_middleware(
+        TrustedHostMiddleware,
+        allowed_hosts=[host.strip() for host in settings.ALLOWED_HOSTS.split(",")]
+    )
+
+class PrecompressedAwareGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that leaves routes serving pre-compressed bodies alone.
+
+    Older Starlette releases would gzip such a body a second time under a single
+    Content-Encoding header, so those paths bypass the middleware entirely.
+    """
+    precompressed_paths = frozenset(("/",))
 
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.precompressed_paths:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Level 5 keeps most of the size reduction of level 9 at a fraction of the CPU
+app.add_middleware(PrecompressedAwareGZipMiddleware, minimum_size=1024, compresslevel=5)
 
 # CORS middleware with secure defaults
 app.add_middleware(
@@ -47,33 +119,63 @@ app.add_middleware(
     max_age=3600
 )
 
-# Security headers middleware
-@app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    response = await call_next(request)
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "DENY"
-    response.headers["X-XSS-Protection"] = "1; mode=block"
-    response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-    response.headers["Content-Security-Policy"] = "default-src 'self'; script-src 'self' 'unsafe-inline'; style-src 'self' 'unsafe-inline';"
-    return response
-
-# Initialize services
-trino_service = TrinoService()
-schema_service = SchemaService(trino_service)
-memory_service = MemoryService()
-ai_service = AIService(trino_service=trino_service, memory_service=memory_service)
-status_service = StatusService(trino_service, memory_service, ai_service)
+# Security headers, pre-encoded once and appended to every response
+SECURITY_HEADERS = [
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"x-xss-protection", b"1; mode=block"),
+    (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+    (b"content-security-policy", b"default-src 'self'; script-src 'self' 'unsafe-inline'; style-src 'self' 'unsafe-inline';"),
+]
+
+class SecurityHeadersMiddleware:
+    """Pure ASGI middleware adding security headers to every response"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), *SECURITY_HEADERS]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+app.add_middleware(SecurityHeadersMiddleware)
 
 # Security
-security = HTTPBearer()
+# Missing credentials are reported by get_current_user rather than HTTPBearer
+security = HTTPBearer(auto_error=False)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+# Verified token payloads keyed by token hash; the short TTL bounds how long
+# a deactivated user or revoked token keeps working
+_token_cache = TTLCache(maxsize=10000, ttl=30)
+_token_cache_lock = threading.Lock()
+
+def _verify_token_cached(token: str) -> Dict:
+    """Verify a JWT, reusing the result for repeated requests with the same token"""
+    key = hashlib.sha256(token.encode()).digest()
+    with _token_cache_lock:
+        payload = _token_cache.get(key)
+    if payload is not None and payload["exp"] > time.time():
+        return payload
+
+    payload = iam_service.verify_token(token)
+    with _token_cache_lock:
+        _token_cache[key] = payload
+    return payload
+
+def _check_permission_cached(token: str, resource: str, action: str) -> bool:
+    """Check a permission for the token's role using the cached token payload"""
+    return iam_service.check_permission(_verify_token_cached(token)["role"], resource, action)
+
+async def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
     """Get current user from JWT token"""
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{current_time}] get_current_user called")
-    logger.log_info("auth", f"get_current_user called at {current_time}")
-    
     try:
         if not credentials:
             raise HTTPException(
@@ -88,7 +190,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
                 detail="No token provided"
             )
             
-        if not iam_service.verify_token(token):
+        if not _verify_token_cached(token):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token"
@@ -104,102 +206,151 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail=f"[Auth Layer] Authentication failed (Component: {e.__class__.__name__})"
         )
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    """Middleware to log requests and responses"""
-    # Generate request ID
-    request_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{id(request)}"
-    request.state.request_id = request_id
-    
-    # Log request
-    log_api_request(
-        route=str(request.url.path),
-        method=request.method,
-        params=dict(request.query_params),
-    )
-    
-    # Time the request
-    start_time = time.time()
-    
-    # Process request
-    try:
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        
-        # Log response
-        log_api_response(
-            route=str(request.url.path),
-            status_code=response.status_code,
-            response_time=process_time
-        )
-        
-        # Add custom headers
-        response.headers["X-Process-Time"] = str(process_time)
-        response.headers["X-Request-ID"] = request_id
-        response.headers["X-Component"] = "API Gateway"
-        
-        return response
-    except Exception as e:
-        process_time = time.time() - start_time
-        error = error_service.handle_error(
-            "request_error",
-            e,
-            {
-                "route": str(request.url.path),
-                "method": request.method,
-                "process_time": process_time,
-                "component": "API Gateway",
-                "layer": "Middleware"
-            }
+def require(resource: str, action: str):
+    """Dependency that authenticates the caller and checks one permission"""
+    async def check(token: str = Depends(get_current_user)) -> str:
+        if not _check_permission_cached(token, resource, action):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Permission denied"
+            )
+        return token
+    return check
+
+require_view = require("ai-analytics", "view")
+require_settings_edit = require("settings", "edit")
+
+class LoggingMiddleware:
+    """Pure ASGI middleware to log requests and responses"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Generate request ID (time-ordered prefix, random suffix)
+        request_id = f"{time.time_ns():x}-{secrets.token_hex(4)}"
+        scope.setdefault("state", {})["request_id"] = request_id
+        route = scope["path"]
+        method = scope["method"]
+
+        # Log request
+        log_api_request(
+            route=route,
+            method=method,
+            params=scope["query_string"],
         )
-        raise error
+
+        # Time the request on the monotonic clock
+        start_ns = time.perf_counter_ns()
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                process_time = (time.perf_counter_ns() - start_ns) / 1e9
+
+                # Log response
+                log_api_response(
+                    route=route,
+                    status_code=message["status"],
+                    response_time=process_time
+                )
+
+                # Add custom headers
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-process-time", str(process_time).encode()),
+                    (b"x-request-id", request_id.encode()),
+                    (b"x-component", b"API Gateway")
+                ]
+            await send(message)
+
+        # Process request
+        try:
+            await self.app(scope, receive, send_with_headers)
+        except Exception as e:
+            process_time = (time.perf_counter_ns() - start_ns) / 1e9
+            error = error_service.handle_error(
+                "request_error",
+                e,
+                {
+                    "route": route,
+                    "method": method,
+                    "process_time": process_time,
+                    "component": "API Gateway",
+                    "layer": "Middleware"
+                }
+            )
+            raise error
+
+app.add_middleware(LoggingMiddleware)
 
 @app.get("/", response_class=HTMLResponse)
-async def root(request: Request):
+async def root(request: Request, credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
     """Login page"""
-    # Check if Authorization header exists
-    auth_header = request.headers.get("Authorization")
-    if auth_header and auth_header.startswith("Bearer "):
+    # Already signed in users go straight to the dashboard
+    if credentials:
         try:
-            token = auth_header.split(" ")[1]
             # Verify token
-            if iam_service.verify_token(token):
+            if _verify_token_cached(credentials.credentials):
                 logger.log_info("auth","Token is valid, redirect to dashboard")
                 return RedirectResponse(url="/dashboard")
         except Exception:
-            print('Token is invalid, show login page')# Token is invalid, show login page
+            # Token is invalid, show login page
             pass
             
-    return Jinja2Templates(directory="app/templates").TemplateResponse(
-        "login.html",
-        {"request": request}
-    )
+    # This path bypasses GZipMiddleware (see PrecompressedAwareGZipMiddleware), so it is only compressed once
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return HTMLResponse(
+            content=LOGIN_PAGE_GZIP,
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+        )
+    return HTMLResponse(content=LOGIN_PAGE)
 
 # Input validation models
 class LoginRequest(BaseModel):
-    username: constr(min_length=3, max_length=50, pattern=r'^[a-zA-Z0-9_]+$')
-    password: constr(min_length=8, max_length=100)
+    username: Annotated[str, StringConstraints(min_length=3, max_length=50, pattern=r'^[a-zA-Z0-9_]+$')]
+    password: Annotated[str, StringConstraints(min_length=8, max_length=100)]
+
+# Characters rejected in free-text questions
+_BAD_QUERY_CHARS = re.compile(r'[\'";]')
+
+def _check_query_text(v: str) -> str:
+    # Prevent SQL injection attempts
+    if _BAD_QUERY_CHARS.search(v):
+        raise ValueError('Invalid characters in query')
+    return v
 
 class AnalyzeRequest(BaseModel):
     query: str
     response: Optional[str] = None
     
-    @validator('query')
+    @field_validator('query')
+    @classmethod
     def validate_query(cls, v):
-        # Prevent SQL injection attempts
-        if re.search(r'[\'";]', v):
-            raise ValueError('Invalid characters in query')
+        return _check_query_text(v)
+
+# Upper bound on questions per batch, to protect Ollama and Trino
+MAX_BATCH_QUESTIONS = 20
+
+class AnalyzeBatchRequest(BaseModel):
+    questions: Annotated[List[str], Field(min_length=1, max_length=MAX_BATCH_QUESTIONS)]
+
+    @field_validator('questions')
+    @classmethod
+    def validate_questions(cls, v):
+        for question in v:
+            _check_query_text(question)
         return v
 
 @app.post("/login")
 async def login(login_request: LoginRequest):
     """Login endpoint with input validation"""
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{current_time}] login called")
-    logger.log_info("auth", f"login called at {current_time}")
-    
     try:
-        result = iam_service.authenticate_user(login_request.username, login_request.password)
+        # bcrypt verification is CPU heavy; keep it off the event loop
+        result = await asyncio.to_thread(iam_service.authenticate_user, login_request.username, login_request.password)
         if not result:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -207,8 +358,8 @@ async def login(login_request: LoginRequest):
             )
             
         # Set token in response headers
-        response = JSONResponse(content=result)
-        logger.log_info("auth", f"Login response: {response.body}")
+        response = FastORJSONResponse(content=result)
+        logger.log_info("auth", "Login succeeded for %s", login_request.username)
         response.headers["Authorization"] = f"Bearer {result['token']}"
         return response
         
@@ -225,28 +376,29 @@ async def login(login_request: LoginRequest):
         )
 
 @app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(request: Request, token: str = Depends(get_current_user)):
+async def dashboard(request: Request, token: str = Depends(require_view)):
     """Dashboard page with authentication"""
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{current_time}] dashboard called")
-    logger.log_info("dashboard", f"dashboard called at {current_time}")
-    
     try:
-        logger.log_info("dashboard", f"Accessing dashboard for token: {token}")
-        
-        if not iam_service.check_permission(token, "view_status"):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Permission denied"
-            )
+        # The page only varies by user and template version, so repeat visits can revalidate cheaply
+        user = _verify_token_cached(token)
+        logger.log_info("dashboard", "Accessing dashboard for %s", user["username"])
+        etag = '"' + hashlib.blake2b(
+            f"{DASHBOARD_DIGEST}:{user['username']}:{user['role']}".encode(),
+            digest_size=8
+        ).hexdigest() + '"'
+        cache_headers = {"ETag": etag, "Cache-Control": "private, max-age=30"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
             
-        return Jinja2Templates(directory="app/templates").TemplateResponse(
+        response = templates.TemplateResponse(
             "dashboard.html",
             {
                 "request": request,
                 "token": token
             }
         )
+        response.headers.update(cache_headers)
+        return response
     except HTTPException as e:
         logger.log_error("dashboard", f"Dashboard access error: {e.detail}")
         raise
@@ -257,28 +409,49 @@ async def dashboard(request: Request, token: str = Depends(get_current_user)):
             detail=f"[Dashboard Layer] Internal server error (Component: Dashboard Handler) - {str(e)}"
         )
 
+# In-flight /analyze and /status calls; identical concurrent requests share a single run
+_inflight_calls: Dict[str, asyncio.Future] = {}
+
+async def _run_coalesced(key: str, run: Callable[[], Awaitable[Any]]) -> Any:
+    """Await run() once for all concurrent callers using the same key"""
+    future = _inflight_calls.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+    
+    future = asyncio.get_running_loop().create_future()
+    _inflight_calls[key] = future
+    try:
+        result = await run()
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # Mark as retrieved in case nobody else was waiting
+        raise
+    finally:
+        del _inflight_calls[key]
+
 @app.post("/analyze")
-async def analyze(request: AnalyzeRequest, token: str = Depends(get_current_user)):
+async def analyze(request: AnalyzeRequest, token: str = Depends(require_view)):
     """Analyze data with input validation"""
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{current_time}] analyze called")
-    logger.log_info("analyze", f"analyze called at {current_time}")
-    
-    if not iam_service.check_permission(token, "analyze_data"):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Permission denied"
-        )
-        
-    start_time = time.time()
+    start_ns = time.perf_counter_ns()
     
     try:
+        username = _verify_token_cached(token)["username"]
+        key = hashlib.blake2b(
+            f"{username}\0{request.query}\0{request.response or ''}".encode(),
+            digest_size=16
+        ).hexdigest()
+        
         if request.response:
             # Continue analysis with user's response
-            result = await ai_service.continue_analysis(request.response)
+            result = await _run_coalesced(key, lambda: ai_service.continue_analysis(request.response))
         else:
             # Start new analysis
-            result = await ai_service.analyze_with_context(request.query)
+            result = await _run_coalesced(key, lambda: ai_service.analyze_with_context(request.query))
 
         if result["status"] == "error":
             raise HTTPException(
@@ -287,12 +460,12 @@ async def analyze(request: AnalyzeRequest, token: str = Depends(get_current_user
             )
         
         # Calculate processing time
-        process_time = time.time() - start_time
+        process_time = (time.perf_counter_ns() - start_ns) / 1e9
         
         # Log success
-        logger.log_info("analyze", f"Analysis completed in {process_time:.2f} seconds")
+        logger.log_info("analyze", "Analysis completed in %.2f seconds", process_time)
         
-        return result
+        return FastORJSONResponse(content=result)
         
     except ValueError as e:
         raise HTTPException(
@@ -308,30 +481,77 @@ async def analyze(request: AnalyzeRequest, token: str = Depends(get_current_user
             detail=f"Internal server error: {str(e)}"
         )
 
+@app.post("/analyze/batch")
+async def analyze_batch(request: AnalyzeBatchRequest, token: str = Depends(require_view)):
+    """Start analyses for several questions in one request"""
+    start_ns = time.perf_counter_ns()
+    
+    try:
+        results = await ai_service.analyze_batch(request.questions)
+        
+        process_time = (time.perf_counter_ns() - start_ns) / 1e9
+        logger.log_info("analyze", "Batch of %d analyses completed in %.2f seconds", len(results), process_time)
+        
+        return FastORJSONResponse(content={"results": results})
+        
+    except Exception as e:
+        logger.log_error("analyze", f"Unexpected error: {str(e)}", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+# (monotonic time, JSON bytes) of the health payload, rebuilt at most once per second
+_health_body = [0.0, b""]
+
+# ETag for the health payload, ignoring the timestamp
+HEALTH_ETAG = '"health-1.0.0"'
+
 @app.get("/health")
-async def health_check():
+async def health_check(request: Request):
     """Health check endpoint"""
-    return {
-        "status": "ok",
-        "timestamp": datetime.now().isoformat(),
-        "version": "1.0.0"
-    }
+    if request.headers.get("if-none-match") == HEALTH_ETAG:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": HEALTH_ETAG})
+        
+    now = time.monotonic()
+    if now - _health_body[0] >= 1:
+        _health_body[:] = [now, orjson.dumps({
+            "status": "ok",
+            "timestamp": datetime.now().isoformat(),
+            "version": "1.0.0"
+        })]
+    return Response(
+        content=_health_body[1],
+        media_type="application/json",
+        headers={"ETag": HEALTH_ETAG}
+    )
+
+VALID_LOG_TYPES = frozenset(LOG_FILES)
+INVALID_LOG_TYPE_MESSAGE = f"Invalid log type. Must be one of: {', '.join(LOG_FILES)}"
+MAX_LOG_LINES = 5000
 
 @app.get("/logs/{log_type}")
-async def view_logs(log_type: str, lines: int = 100):
+async def view_logs(
+    log_type: str,
+    lines: int = Query(100, ge=1, le=MAX_LOG_LINES),
+    token: str = Depends(require_settings_edit)
+):
     """View logs endpoint"""
-    valid_log_types = ["app", "api", "trino", "ai", "prompts", "responses"]
-    
-    if log_type not in valid_log_types:
+    if log_type not in VALID_LOG_TYPES:
         raise error_service.handle_error(
             "validation_error",
-            ValueError(f"Invalid log type. Must be one of: {', '.join(valid_log_types)}"),
+            ValueError(INVALID_LOG_TYPE_MESSAGE),
             {"log_type": log_type}
         )
         
     try:
-        # Log viewing logic here
-        return {"message": f"Viewing {lines} lines of {log_type} logs"}
+        # Both touch the disk; keep them off the event loop
+        await asyncio.to_thread(flush_logs)
+        tail = await asyncio.to_thread(tail_log, log_type, lines)
+        return StreamingResponse(
+            (line + b"\n" for line in tail),
+            media_type="text/plain; charset=utf-8"
+        )
     except Exception as e:
         raise error_service.handle_error(
             "log_error",
@@ -339,19 +559,49 @@ async def view_logs(log_type: str, lines: int = 100):
             {"log_type": log_type, "lines": lines}
         )
 
+# /status results are reused briefly so polling dashboards don't probe every backend on each refresh
+_status_cache = TTLCache(maxsize=1, ttl=5)
+
+async def _refresh_status() -> Dict[str, Any]:
+    """Probe the backends and cache the resulting status payload"""
+    status_payload = await status_service.get_status()
+    _status_cache["status"] = status_payload
+    return status_payload
+
 @app.get("/status")
-async def get_status(token: str = Depends(get_current_user)):
+async def get_status(token: str = Depends(require_view)):
     """Get service status"""
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{current_time}] get_status called")
-    logger.log_info("status", f"get_status called at {current_time}")
-    
-    if not iam_service.check_permission(token, "view_status"):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Permission denied"
-        )
-    return status_service.get_status()
+    status_payload = _status_cache.get("status")
+    if status_payload is None:
+        # Pollers arriving while the cache is cold wait on the same probe
+        status_payload = await _run_coalesced("status", _refresh_status)
+    return FastORJSONResponse(content=status_payload)
+
+@app.post("/admin/schema/invalidate")
+async def invalidate_schema(token: str = Depends(require_settings_edit)):
+    """Clear cached database schema information (e.g. after DDL changes)"""
+    user = _verify_token_cached(token)
+    ai_service.invalidate_schema()
+    schema_service.invalidate_schema_cache()
+    # Cached follow-up questions and classifications were written against the old schema
+    await asyncio.to_thread(memory_service.clear_response_cache)
+    logger.log_info("schema", "Schema cache invalidated by %s", user["username"])
+    return {"status": "ok"}
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host=settings.APP_HOST, port=settings.APP_PORT, reload=True)
\ No newline at end of file
+    if settings.APP_ENV == "production":
+        uvicorn.run(
+            "app.main:app",
+            host=settings.APP_HOST,
+            port=settings.APP_PORT,
+            workers=settings.APP_WORKERS or (os.cpu_count() or 1) * 2 + 1,
+            loop="uvloop",
+            http="httptools",
+            log_level="info",
+            # Requests are already logged by LoggingMiddleware through the queued handlers
+            log_config=None,
+            access_log=False
+        )
+    else:
+        # Development only: the reloader runs a single worker on the default setup
+        uvicorn.run("app.main:app", host=settings.APP_HOST, port=settings.APP_PORT, reload=True)
\ No newline at end of file
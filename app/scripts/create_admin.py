@@ -1,5 +1,5 @@
 from app.services.iam_service import IAMService
-from app.core.logging import logger
+from app.logging.logger import init_logging, logger
 
 def create_admin_user():
     """Create an admin user"""
@@ -22,4 +22,5 @@ def create_admin_user():
         print("Failed to create admin user")
 
 if __name__ == "__main__":
+    init_logging()
     create_admin_user() 
\ No newline at end of file
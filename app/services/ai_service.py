@@ -1,11 +1,282 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+import asyncio
+import contextlib
+import functools
+import hashlib
+import heapq
 import httpx
-import json
+import orjson
+import re
+import time
+from cachetools import TTLCache
 from datetime import datetime
-from app.config import settings
+from app.config.settings import settings
 from app.services.memory_service import MemoryService
 from app.services.error_service import ErrorService
 from app.services.trino_service import TrinoService
+from app.logging.logger import log_ai_response, logger
+
+# Characters and comment markers not allowed in generated SQL
+_INVALID_SQL_CHARS = re.compile(r":|;|--|/\*|\*/")
+# Clause keywords checked by validation; typed joins come first so they win over a bare JOIN
+_SQL_CLAUSES = re.compile(
+    r"\b(INNER\s+JOIN|LEFT\s+JOIN|RIGHT\s+JOIN|FULL\s+JOIN|JOIN|FROM|WHERE|GROUP\s+BY|ORDER\s+BY)\b",
+    re.IGNORECASE
+)
+_TYPED_JOINS = frozenset(("INNER JOIN", "LEFT JOIN", "RIGHT JOIN", "FULL JOIN"))
+# SELECT as a whole keyword, so words like "Selected" don't pass for a query
+_SELECT_START = re.compile(r"select\b", re.IGNORECASE)
+
+# Time periods that can be taken from a user's answer without asking the model
+_TIME_PERIOD = re.compile(
+    r"\b(?:(?:last|past|previous|this|current)\s+(?:\d+\s+)?(?:day|week|month|quarter|year)s?"
+    r"|yesterday|today|ytd|mtd|q[1-4](?:\s+(?:19|20)\d{2})?|(?:19|20)\d{2})\b",
+    re.IGNORECASE
+)
+_WORDS = re.compile(r"\w+")
+
+# Vocabulary for classifying users without asking the model; only a clear margin is trusted
+_TECHNICAL_TERMS = re.compile(
+    r"\b(?:sql|select|join|schema|columns?|tables?|group by|count|sum|avg|index|partition|query|null|distinct)\b",
+    re.IGNORECASE
+)
+_BUSINESS_TERMS = re.compile(
+    r"\b(?:revenue|sales|profit|trends?|forecast|customers?|growth|churn|margin|kpis?|performance|insights?|market)\b",
+    re.IGNORECASE
+)
+USER_TYPE_MARGIN = 2
+
+_JSON_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+
+def _extract_json(text: str) -> Any:
+    """Parse the first JSON array or object in a model reply, ignoring code fences and prose"""
+    fenced = _JSON_FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    start = min((i for i in (text.find("["), text.find("{")) if i != -1), default=-1)
+    if start == -1:
+        raise orjson.JSONDecodeError("No JSON value found", text, 0)
+        
+    # Find the matching closing bracket, skipping brackets inside strings
+    depth = 0
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "[{":
+            depth += 1
+        elif ch in "]}":
+            depth -= 1
+            if depth == 0:
+                return orjson.loads(text[start:i + 1])
+    raise orjson.JSONDecodeError("Unterminated JSON value", text, start)
+
+JSON_HEADERS = {"content-type": "application/json"}
+
+# How long Ollama keeps the model loaded after a request
+OLLAMA_KEEP_ALIVE = "30m"
+# Concurrent generations sent to Ollama (its default OLLAMA_NUM_PARALLEL is 4); the rest wait here
+OLLAMA_MAX_PARALLEL = 4
+
+# Seconds an availability probe is reused; failures are re-probed sooner to notice recovery
+AVAILABILITY_TTL = 10
+UNAVAILABILITY_TTL = 1
+
+# Probes fail fast instead of inheriting the long generation timeout
+PROBE_TIMEOUT = httpx.Timeout(3.0, connect=1.0)
+
+def _availability_ttl(available: bool) -> float:
+    return AVAILABILITY_TTL if available else UNAVAILABILITY_TTL
+
+# Fields tracked while narrowing down an analysis; the list fields collect several values
+CONTEXT_SCALAR_FIELDS = ("user_type", "time_period", "scope")  # user_type is "technical" or "business"
+CONTEXT_LIST_FIELDS = ("metrics", "tables", "columns", "relationships")
+
+def _new_context(**values: Any) -> Dict[str, Any]:
+    """Build an empty analysis context, optionally with some fields already set"""
+    context = dict.fromkeys(CONTEXT_SCALAR_FIELDS)
+    for field in CONTEXT_LIST_FIELDS:
+        context[field] = []
+    context.update(values)
+    return context
+
+# Sample rows shown to the model; the full result is described by its row count and column stats
+ANALYSIS_RESULT_ROWS = 50
+
+# Tables included in a prompt; larger schemas are narrowed to those most related to the question
+SCHEMA_PROMPT_TABLES = 30
+
+def _to_prompt_json(value: Any) -> str:
+    """Serialize a value as indented JSON text for a prompt"""
+    return orjson.dumps(value, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+
+# SQL generation prompts, filled in with str.format_map. Static instructions come first and
+# per-request values last, so the model server can reuse its cache of the shared prefix.
+_SQL_PROMPT = """
+Generate a valid Trino SQL query that would answer the question below.
+Important rules for Trino SQL:
+1. Use standard SQL syntax
+2. NEVER use ':' character in any part of the query
+3. Use proper table aliases (e.g., t1, t2) for joins
+4. Use standard SQL operators (=, <, >, etc.)
+5. Use proper date/time functions (e.g., DATE_TRUNC, DATE_ADD)
+6. Use proper string functions (e.g., CONCAT, SUBSTRING)
+7. Use proper aggregation functions (e.g., COUNT, SUM, AVG)
+8. Use proper window functions if needed (e.g., ROW_NUMBER, RANK)
+9. Use proper JOIN syntax (INNER JOIN, LEFT JOIN, etc.)
+10. Use proper WHERE clause syntax
+11. Do not use any special characters except standard SQL operators
+12. Use proper column aliases without special characters
+13. Do not use JSON or array syntax
+14. Do not use any special formatting
+
+Return only the SQL query without any explanation or comments.
+
+Here is the database schema information:
+{schema_context}
+
+{memory_context}
+
+Question: "{question}"
+"""
+
+# Simpler fallback requested alongside the first attempt
+_SQL_SIMPLER_PROMPT = """
+The previous query contained invalid characters. Please generate a new query that:
+1. Uses only basic SELECT, FROM, WHERE clauses
+2. Uses no special characters (especially ':')
+3. Uses simple column aliases (e.g., col1, col2)
+4. Uses standard SQL operators only
+5. Does not use any JSON or array syntax
+6. Does not use any special formatting
+
+Schema: {schema_context}
+
+{memory_context}
+
+Original question: "{question}"
+"""
+
+# Retry after Trino rejected the generated query
+_SQL_AFTER_ERROR_PROMPT = """
+The previous query failed in Trino. Please generate a simpler query that follows these rules:
+1. Use only basic SELECT, FROM, WHERE clauses
+2. No complex joins or subqueries
+3. No special characters (especially ':')
+4. No comments
+5. Make sure all table and column names exist in the schema
+6. Do not use any JSON or array syntax
+7. Do not use any special formatting
+
+Schema: {schema_context}
+
+{memory_context}
+
+Original question: "{question}"
+Trino error: {error}
+"""
+
+# SHOW statements passed through as-is; the keyword after SHOW keeps "show me ..." questions out
+_RAW_SHOW = re.compile(
+    r"^\s*show\s+(?:catalogs|schemas|tables|columns\s+(?:from|in)|create\s+(?:table|view)|functions|stats\s+for)\b",
+    re.IGNORECASE
+)
+# The select list of a SELECT statement, with quoted and parenthesized parts dropped before checking
+_SELECT_LIST = re.compile(r"^\s*select\s+(.+?)\s+from\s", re.IGNORECASE | re.DOTALL)
+_QUOTED_OR_NESTED = re.compile(r"'[^']*'|\"[^\"]*\"|\([^()]*\)")
+_BARE_WORD_RUN = re.compile(r"[\w.*]+(?:\s+[\w.*]+)+")
+# Keywords that legitimately put several bare words in a row inside a select list
+_SELECT_LIST_KEYWORDS = frozenset((
+    "AS", "CASE", "WHEN", "THEN", "ELSE", "END", "AND", "OR", "NOT", "IS", "NULL", "IN",
+    "BETWEEN", "LIKE", "DISTINCT", "OVER", "FILTER", "INTERVAL"
+))
+# Simple questions about a single table answered from a template, as (pattern, SQL template)
+_DIRECT_QUERIES = (
+    (re.compile(r"^\s*(?:list|show)\s+all\s+(?:rows\s+(?:in|from)\s+)?(\w+)\s*\??\s*$", re.IGNORECASE),
+     "SELECT * FROM {table} LIMIT 100"),
+    (re.compile(r"^\s*(?:count\s+(?:of\s+)?(?:rows\s+in\s+)?|how\s+many\s+(?:rows\s+(?:are\s+)?in\s+)?)(\w+)\s*\??\s*$", re.IGNORECASE),
+     "SELECT COUNT(*) AS row_count FROM {table}"),
+)
+
+def _is_select_statement(text: str) -> bool:
+    """Whether text reads as a SELECT statement rather than a question starting with "select"
+
+    An English phrase such as "Select the top customers from sales" passes the clause
+    checks, but its select list is three bare words in a row, which SQL never has
+    without an AS or another keyword between them.
+    """
+    if not _validate_sql_query(text)[0]:
+        return False
+    select_list = _SELECT_LIST.match(text)
+    if not select_list:
+        return False
+    items = select_list.group(1)
+    while True:
+        stripped = _QUOTED_OR_NESTED.sub(" ", items)
+        if stripped == items:
+            break
+        items = stripped
+    for run in _BARE_WORD_RUN.findall(items):
+        words = run.split()
+        if len(words) > 2 and _SELECT_LIST_KEYWORDS.isdisjoint(word.upper() for word in words):
+            return False
+    return True
+
+def _direct_query(question: str, schema_context: str) -> Optional[Tuple[str, str]]:
+    """Return (reason, SQL) for questions that don't need the model, or None"""
+    # Questions already written as a read-only statement are passed through, pending the EXPLAIN check
+    statement = question.strip().rstrip(";")
+    if _RAW_SHOW.match(statement) or _is_select_statement(statement):
+        return "raw_sql", statement
+    for pattern, template in _DIRECT_QUERIES:
+        match = pattern.match(question)
+        # Only for names the schema context lists as tables, so the template can't guess
+        if match and re.search(rf"Table: {re.escape(match.group(1))}$", schema_context, re.IGNORECASE | re.MULTILINE):
+            return "template", template.format(table=match.group(1))
+    return None
+
+@functools.lru_cache(maxsize=1024)
+def _validate_sql_query(query: str) -> Tuple[bool, str]:
+    """Validate SQL query for Trino compatibility in a single scan over the text"""
+    # Remove comments
+    query = query.split('--')[0].strip()
+    
+    # Check for invalid characters
+    invalid = _INVALID_SQL_CHARS.search(query)
+    if invalid:
+        return False, f"Invalid character '{invalid.group()}' found in query"
+    
+    # Check for basic SQL structure
+    if not _SELECT_START.match(query):
+        return False, "Query must start with SELECT"
+    
+    # Position just past the first occurrence of each clause keyword
+    clause_ends = {}
+    for match in _SQL_CLAUSES.finditer(query):
+        clause_ends.setdefault(" ".join(match.group(1).upper().split()), match.end())
+    
+    # Check for proper FROM clause
+    if 'FROM' not in clause_ends:
+        return False, "Query must contain a FROM clause"
+    
+    # Check for proper JOIN syntax
+    if 'JOIN' in clause_ends and _TYPED_JOINS.isdisjoint(clause_ends):
+        return False, "Invalid JOIN syntax"
+    
+    # Check that WHERE, GROUP BY and ORDER BY are followed by something
+    for clause in ('WHERE', 'GROUP BY', 'ORDER BY'):
+        if clause in clause_ends and not query[clause_ends[clause]:].strip():
+            return False, f"{clause} clause cannot be empty"
+    
+    return True, "Query is valid"
 
 class AIService:
     def __init__(self, trino_service: TrinoService, memory_service: MemoryService):
@@ -14,67 +285,134 @@ class AIService:
         self.base_url = "http://localhost:11434"
         self.model = "llama2"
         self.conversation_history = []
-        self.analysis_context = {
-            "user_type": None,  # "technical" or "business"
-            "time_period": None,
-            "scope": None,
-            "metrics": [],
-            "tables": [],
-            "columns": [],
-            "relationships": []
-        }
+        self.analysis_context = _new_context()
         self.api_url = f"{settings.OLLAMA_API_URL}/generate"
         self.error_service = ErrorService()
+        self._pending_writes = set()
+        # Model replies keyed by (model, whitespace-normalized prompt); repeated questions skip inference
+        self._response_cache = TTLCache(maxsize=1024, ttl=3600)
+        self.response_cache_stats = {"hits": 0, "misses": 0}
+        # Validated SQL keyed by (model, schema digest, question); recalled memories don't split the key
+        self._query_cache = TTLCache(maxsize=256, ttl=settings.SCHEMA_CACHE_TTL)
+        # Database schema rarely changes; cache it rather than re-querying information_schema each turn
+        # Holds the schema dict and its prompt index, which expire together
+        self._schema_cache = TTLCache(maxsize=2, ttl=300)
+        # One pooled client for all Ollama calls, so requests reuse keep-alive connections.
+        # Generation can take minutes, so only connecting is held to a short timeout.
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            # Connection failures are retried on the transport, so a dropped keep-alive socket isn't fatal
+            transport=httpx.AsyncHTTPTransport(
+                retries=2,
+                limits=httpx.Limits(max_keepalive_connections=40, max_connections=100, keepalive_expiry=30.0)
+            )
+        )
+        # Availability probes are reused briefly as (expires_at, available) instead of re-probing per call
+        self._ollama_availability = (0.0, False)
+        self._trino_availability = (0.0, False)
+        # Caps generations across all callers, so a large batch can't queue past the client timeout
+        self._generation_slots = asyncio.Semaphore(OLLAMA_MAX_PARALLEL)
         
     async def check_ollama_availability(self) -> bool:
         """Check if Ollama service is available"""
+        expires_at, available = self._ollama_availability
+        if time.monotonic() < expires_at:
+            return available
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.base_url}/api/tags")
-                return response.status_code == 200
+            response = await self._http.get("/api/tags", timeout=PROBE_TIMEOUT)
+            available = response.status_code == 200
         except Exception:
-            return False
-        
+            available = False
+        self._ollama_availability = (time.monotonic() + _availability_ttl(available), available)
+        return available
+
+    async def close(self) -> None:
+        """Finish and flush pending memory writes and close the pooled HTTP client"""
+        await asyncio.gather(*self._pending_writes, return_exceptions=True)
+        await asyncio.to_thread(self.memory_service.flush)
+        await self._http.aclose()
+
+    def _write_in_background(self, write, *args, **kwargs) -> None:
+        """Run a memory write in a worker thread without blocking the response"""
+        task = asyncio.create_task(asyncio.to_thread(write, *args, **kwargs))
+        # Keep a reference so the task isn't garbage collected before it finishes
+        self._pending_writes.add(task)
+        task.add_done_callback(self._write_done)
+
+    def _write_done(self, task: asyncio.Task) -> None:
+        self._pending_writes.discard(task)
+        if not task.cancelled():
+            task.exception()  # MemoryService already logged any failure
+        
+    def invalidate_schema(self) -> None:
+        """Drop the cached database schema (e.g. after DDL changes)"""
+        self._schema_cache.clear()
+
+    def _schema_index(self, schema_info: Dict[str, Any]) -> List[Tuple[frozenset, str]]:
+        """Identifier words and prompt line per table, reused while the schema is cached"""
+        cached = self._schema_cache.get("schema_index")
+        if cached is not None and cached[0] is schema_info:
+            return cached[1]
+        index = []
+        for schema, tables in schema_info.items():
+            for table_name, columns in tables.items():
+                words = set(_WORDS.findall(table_name.lower().replace("_", " ")))
+                for col in columns:
+                    words.update(_WORDS.findall(col["name"].lower().replace("_", " ")))
+                line = f"{schema}.{table_name}(" + ", ".join(f"{col['name']} {col['type']}" for col in columns) + ")"
+                index.append((frozenset(words), line))
+        if self._schema_cache.get("schema") is schema_info:
+            self._schema_cache["schema_index"] = (schema_info, index)
+        return index
+
+    def _schema_summary(self, schema_info: Dict[str, Any], user_input: str) -> str:
+        """Compact schema text for a prompt, narrowed to the tables most related to the input"""
+        index = self._schema_index(schema_info)
+        if len(index) > SCHEMA_PROMPT_TABLES:
+            words = set(_WORDS.findall(user_input.lower().replace("_", " ")))
+            index = heapq.nlargest(SCHEMA_PROMPT_TABLES, index, key=lambda entry: len(entry[0] & words))
+        return "\n".join(line for _, line in index)
+
     async def get_database_schema(self) -> Dict[str, Any]:
         """Get database schema information from Trino"""
+        schema_info = self._schema_cache.get("schema")
+        if schema_info is not None:
+            return schema_info
+        
         try:
-            # Get tables
-            tables_query = """
-                SELECT table_schema, table_name 
-                FROM information_schema.tables 
+            # Fetch every column in one round trip and group by table client-side
+            columns_query = """
+                SELECT table_schema, table_name, column_name, data_type
+                FROM information_schema.columns
                 WHERE table_schema NOT IN ('information_schema', 'sys')
+                ORDER BY table_schema, table_name, ordinal_position
             """
-            tables_result = await self.trino_service.execute_query(tables_query)
+            columns_result = await asyncio.to_thread(self.trino_service.execute_query_rows, columns_query)
             
             schema_info = {}
-            for table in tables_result:
-                schema = table['table_schema']
-                table_name = table['table_name']
-                
-                # Get columns for each table
-                columns_query = f"""
-                    SELECT column_name, data_type 
-                    FROM information_schema.columns 
-                    WHERE table_schema = '{schema}' 
-                    AND table_name = '{table_name}'
-                """
-                columns_result = await self.trino_service.execute_query(columns_query)
-                
-                if schema not in schema_info:
-                    schema_info[schema] = {}
-                
-                schema_info[schema][table_name] = [
-                    {"name": col['column_name'], "type": col['data_type']}
-                    for col in columns_result
-                ]
+            for table_schema, table_name, column_name, data_type in columns_result.get("rows", []):
+                schema_info.setdefault(table_schema, {}).setdefault(table_name, []).append(
+                    {"name": column_name, "type": data_type}
+                )
             
+            # Don't pin an empty schema for the whole TTL when Trino was unreachable
+            if "error" not in columns_result:
+                self._schema_cache["schema"] = schema_info
             return schema_info
         except Exception as e:
-            print(f"Error getting database schema: {str(e)}")
+            logger.log_error("ai", "Error getting database schema", e)
             return {}
 
     async def determine_user_type(self, user_input: str) -> str:
         """Determine if user is technical or business user based on their input"""
+        # Clear-cut inputs are classified by vocabulary; ambiguous ones go to the model
+        margin = len(_TECHNICAL_TERMS.findall(user_input)) - len(_BUSINESS_TERMS.findall(user_input))
+        if margin >= USER_TYPE_MARGIN:
+            return "technical"
+        if margin <= -USER_TYPE_MARGIN:
+            return "business"
+            
         prompt = f"""
         Analyze the following user input and determine if the user is a technical or business user.
         Technical users typically use technical terms, mention specific metrics, or ask for detailed data.
@@ -85,17 +423,20 @@ class AIService:
         Respond with only "technical" or "business".
         """
         
-        response = await self.query_model(prompt)
+        response = await self.query_model_for("user_type", user_input, prompt)
         return response.lower().strip()
 
-    async def generate_follow_up_questions(self, user_input: str, schema_info: Dict[str, Any]) -> List[str]:
+    async def generate_follow_up_questions(
+        self, user_input: str, schema_info: Dict[str, Any], semantic_cache: bool = True
+    ) -> List[str]:
         """Generate relevant follow-up questions based on user input and database schema"""
         prompt = f"""
         As a data analyst, generate follow-up questions to clarify the user's analysis request.
         Consider the following context:
         
         User Input: {user_input}
-        Database Schema: {json.dumps(schema_info, indent=2)}
+        Database Schema (schema.table(column type, ...)):
+        {self._schema_summary(schema_info, user_input)}
         
         Generate 3-5 specific questions that will help:
         1. Clarify the time period of interest
@@ -106,19 +447,46 @@ class AIService:
         Format the response as a JSON array of questions.
         """
         
-        response = await self.query_model(prompt)
+        if semantic_cache:
+            response = await self.query_model_for("follow_up", user_input, prompt)
+        else:
+            response = await self.query_model(prompt)
         try:
-            return json.loads(response)
-        except:
-            return ["Could you clarify the time period you're interested in?",
-                   "What specific metrics would you like to analyze?",
-                   "What is the scope of your analysis?"]
+            questions = _extract_json(response)
+        except orjson.JSONDecodeError:
+            questions = None
+        if isinstance(questions, list):
+            return questions
+        return ["Could you clarify the time period you're interested in?",
+                "What specific metrics would you like to analyze?",
+                "What is the scope of your analysis?"]
+
+    def _try_rule_based_update(self, user_response: str) -> None:
+        """Fill context fields that can be read straight from the user's response"""
+        if not self.analysis_context.get("time_period"):
+            match = _TIME_PERIOD.search(user_response)
+            if match:
+                self.analysis_context["time_period"] = match.group(0)
+                
+        # Table names are matched against the cached schema only; no Trino round trip here
+        schema_info = self._schema_cache.get("schema")
+        if schema_info:
+            words = set(_WORDS.findall(user_response.lower()))
+            tables = self.analysis_context.setdefault("tables", [])
+            for schema_tables in schema_info.values():
+                for table_name in schema_tables:
+                    if table_name.lower() in words and table_name not in tables:
+                        tables.append(table_name)
 
     async def update_analysis_context(self, user_response: str) -> None:
         """Update analysis context based on user's response"""
+        self._try_rule_based_update(user_response)
+        if self.is_context_complete():
+            return
+            
         prompt = f"""
         Update the analysis context based on the user's response.
-        Current Context: {json.dumps(self.analysis_context, indent=2)}
+        Current Context: {_to_prompt_json(self.analysis_context)}
         User Response: {user_response}
         
         Update the following fields if information is provided:
@@ -134,12 +502,13 @@ class AIService:
         
         response = await self.query_model(prompt)
         try:
-            updated_context = json.loads(response)
+            updated_context = _extract_json(response)
+        except orjson.JSONDecodeError:
+            return
+        if isinstance(updated_context, dict):
             self.analysis_context.update(updated_context)
-        except:
-            pass
 
-    async def is_context_complete(self) -> bool:
+    def is_context_complete(self) -> bool:
         """Check if we have enough information to generate SQL"""
         required_fields = ['time_period', 'scope', 'metrics']
         return all(self.analysis_context.get(field) for field in required_fields)
@@ -148,7 +517,7 @@ class AIService:
         """Generate SQL query based on collected context"""
         prompt = f"""
         Generate a SQL query based on the following analysis context:
-        {json.dumps(self.analysis_context, indent=2)}
+        {_to_prompt_json(self.analysis_context)}
         
         Consider the following:
         1. Use appropriate table joins
@@ -163,6 +532,11 @@ class AIService:
 
     async def analyze_with_context(self, user_input: str) -> Dict[str, Any]:
         """Main analysis function using chain of thought approach"""
+        # Fetch the schema from Trino while Ollama is probed; if Ollama is down it still warms the cache
+        schema_task = asyncio.create_task(self.get_database_schema())
+        # Held like the background writes, so it still finishes when nothing awaits it below
+        self._pending_writes.add(schema_task)
+        schema_task.add_done_callback(self._write_done)
         if not await self.check_ollama_availability():
             return {
                 "error": "Ollama service is not available",
@@ -171,25 +545,19 @@ class AIService:
 
         try:
             # Initialize or reset context
-            self.analysis_context = {
-                "user_type": None,
-                "time_period": None,
-                "scope": None,
-                "metrics": [],
-                "tables": [],
-                "columns": [],
-                "relationships": []
-            }
-
-            # Determine user type
-            user_type = await self.determine_user_type(user_input)
-            self.analysis_context["user_type"] = user_type
+            self.analysis_context = _new_context()
 
-            # Get database schema
-            schema_info = await self.get_database_schema()
+            async def follow_up_questions() -> List[str]:
+                # Wait for the database schema, then generate initial follow-up questions
+                schema_info = await schema_task
+                return await self.generate_follow_up_questions(user_input, schema_info)
 
-            # Generate initial follow-up questions
-            questions = await self.generate_follow_up_questions(user_input, schema_info)
+            # The user type and the follow-up questions are independent, so run them together
+            user_type, questions = await asyncio.gather(
+                self.determine_user_type(user_input),
+                follow_up_questions()
+            )
+            self.analysis_context["user_type"] = user_type
 
             return {
                 "status": "questions",
@@ -203,6 +571,39 @@ class AIService:
                 "status": "error"
             }
 
+    async def analyze_batch(self, user_inputs: List[str]) -> List[Dict[str, Any]]:
+        """Start analyses for several questions sharing one availability check and schema fetch"""
+        if not await self.check_ollama_availability():
+            return [{
+                "question": user_input,
+                "error": "Ollama service is not available",
+                "status": "error"
+            } for user_input in user_inputs]
+
+        schema_info = await self.get_database_schema()
+
+        async def run_one(user_input: str) -> Dict[str, Any]:
+            # Each question gets its own context so the conversational one is left untouched
+            try:
+                user_type, questions = await asyncio.gather(
+                    self.determine_user_type(user_input),
+                    self.generate_follow_up_questions(user_input, schema_info)
+                )
+                return {
+                    "question": user_input,
+                    "status": "questions",
+                    "questions": questions,
+                    "context": _new_context(user_type=user_type)
+                }
+            except Exception as e:
+                return {
+                    "question": user_input,
+                    "error": f"Error in analysis: {str(e)}",
+                    "status": "error"
+                }
+
+        return await asyncio.gather(*(run_one(user_input) for user_input in user_inputs))
+
     async def continue_analysis(self, user_response: str) -> Dict[str, Any]:
         """Continue analysis with user's response"""
         if not await self.check_ollama_availability():
@@ -216,10 +617,13 @@ class AIService:
             await self.update_analysis_context(user_response)
 
             # Check if we have enough information
-            if await self.is_context_complete():
+            if self.is_context_complete():
                 # Generate and execute SQL query
                 sql_query = await self.generate_sql_query()
-                query_result = await self.trino_service.execute_query(sql_query)
+                # A sample of the rows plus aggregates over all of them keeps the prompt small
+                query_result = await asyncio.to_thread(
+                    self.trino_service.summarize_query, sql_query, ANALYSIS_RESULT_ROWS
+                )
 
                 # Analyze results
                 analysis = await self.analyze_results(query_result)
@@ -233,9 +637,12 @@ class AIService:
             else:
                 # Generate more follow-up questions
                 schema_info = await self.get_database_schema()
+                # Mid-conversation input is mostly the shared context, so near-duplicate
+                # matching would hand back another conversation's questions
                 questions = await self.generate_follow_up_questions(
-                    f"Previous context: {json.dumps(self.analysis_context)}\nUser response: {user_response}",
-                    schema_info
+                    f"Previous context: {_to_prompt_json(self.analysis_context)}\nUser response: {user_response}",
+                    schema_info,
+                    semantic_cache=False
                 )
 
                 return {
@@ -250,34 +657,95 @@ class AIService:
                 "status": "error"
             }
 
+    async def query_model_for(self, kind: str, question: str, prompt: str) -> str:
+        """Query the model, reusing the reply given earlier for a near-identical question of the same kind"""
+        # The exact prompt cache is free to check; only embed the question when it misses
+        if (self.model, " ".join(prompt.split())) in self._response_cache:
+            return await self.query_model(prompt)
+        cached = await asyncio.to_thread(self.memory_service.find_cached_response, kind, question)
+        if cached is not None:
+            return cached
+        reply = await self.query_model(prompt)
+        self._write_in_background(self.memory_service.cache_response, kind, question, reply)
+        return reply
+
     async def query_model(self, prompt: str) -> str:
         """Query the Ollama model"""
+        key = (self.model, " ".join(prompt.split()))
+        cached = self._response_cache.get(key)
+        if cached is not None:
+            self.response_cache_stats["hits"] += 1
+            return cached
+        self.response_cache_stats["misses"] += 1
+            
+        reply = "".join([chunk async for chunk in self.query_model_stream(prompt)])
+        log_ai_response(self.model, reply)
+        self._response_cache[key] = reply
+        return reply
+
+    async def query_model_stream(self, prompt: str) -> AsyncIterator[str]:
+        """Yield the model's reply as it is generated; closing early aborts the generation"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                json={
+            async with self._generation_slots, self._http.stream(
+                "POST",
+                "/api/generate",
+                content=orjson.dumps({
                     "model": self.model,
                     "prompt": prompt,
-                    "stream": False
-                    }
-                )
-                if response.status_code == 200:
-                    return response.json()["response"]
-                else:
+                    "stream": True,
+                    # Keep the model and its prompt cache loaded between requests
+                    "keep_alive": OLLAMA_KEEP_ALIVE
+                }),
+                headers=JSON_HEADERS
+            ) as response:
+                if response.status_code != 200:
+                    if response.status_code >= 500:
+                        # Don't keep vouching for a server that is failing
+                        self._ollama_availability = (0.0, False)
+                    await response.aread()
                     raise Exception(f"Model query failed: {response.text}")
+                # Parse the NDJSON body as bytes; orjson reads UTF-8 directly, so skip the str decode
+                buffer = b""
+                async for data in response.aiter_bytes():
+                    buffer += data
+                    *lines, buffer = buffer.split(b"\n")
+                    for line in lines:
+                        if not line.strip():
+                            continue
+                        chunk = orjson.loads(line)
+                        yield chunk.get("response", "")
+                        if chunk.get("done"):
+                            return
+                if buffer.strip():
+                    yield orjson.loads(buffer).get("response", "")
         except Exception as e:
             raise Exception(f"Error querying model: {str(e)}")
 
-    async def analyze_results(self, results: List[Dict[str, Any]]) -> str:
+    async def _generate_sql_text(self, prompt: str) -> str:
+        """Stream a query from the model, stopping as soon as it emits a ':'"""
+        parts = []
+        async with contextlib.aclosing(self.query_model_stream(prompt)) as chunks:
+            async for chunk in chunks:
+                parts.append(chunk)
+                if ':' in chunk:
+                    break
+        return "".join(parts)
+
+    async def analyze_results(self, results: Dict[str, Any]) -> str:
         """Analyze query results using the LLM"""
         try:
+            if "error" in results:
+                data = f"Results: {_to_prompt_json(results)}"
+            else:
+                sample = [dict(zip(results["columns"], row)) for row in results["rows"]]
+                data = (
+                    f"Sample rows ({len(sample)} of {results['row_count']}): {_to_prompt_json(sample)}\n"
+                    f"Aggregates: {_to_prompt_json(results['numeric_columns'])}"
+                )
+
+            # Instructions first and results last, keeping the shared prefix cacheable
             prompt = f"""
-            Analyze the following query results and provide insights:
-            
-            Results: {json.dumps(results, indent=2)}
-            
-            Context: {json.dumps(self.analysis_context, indent=2)}
+            Analyze the query results below and provide insights.
             
             Provide a detailed analysis focusing on:
             1. Key findings and trends
@@ -286,6 +754,10 @@ class AIService:
             4. Recommendations
             
             Format the response in clear sections with bullet points where appropriate.
+            
+            Context: {_to_prompt_json(self.analysis_context)}
+            
+            {data}
             """
             
             return await self.query_model(prompt)
@@ -294,101 +766,72 @@ class AIService:
 
     def validate_sql_query(self, query):
         """Validate SQL query for Trino compatibility"""
-        # Remove comments
-        query = query.split('--')[0].strip()
-        
-        # Check for invalid characters
-        invalid_chars = [':', ';', '--', '/*', '*/']
-        for char in invalid_chars:
-            if char in query:
-                return False, f"Invalid character '{char}' found in query"
-        
-        # Check for basic SQL structure
-        if not query.upper().startswith('SELECT'):
-            return False, "Query must start with SELECT"
-            
-        # Check for proper FROM clause
-        if 'FROM' not in query.upper():
-            return False, "Query must contain a FROM clause"
-            
-        # Check for proper JOIN syntax
-        if 'JOIN' in query.upper():
-            if not any(join_type in query.upper() for join_type in ['INNER JOIN', 'LEFT JOIN', 'RIGHT JOIN', 'FULL JOIN']):
-                return False, "Invalid JOIN syntax"
-                
-        # Check for proper WHERE clause
-        if 'WHERE' in query.upper():
-            where_clause = query.upper().split('WHERE')[1].strip()
-            if not where_clause:
-                return False, "WHERE clause cannot be empty"
-                
-        # Check for proper GROUP BY clause
-        if 'GROUP BY' in query.upper():
-            group_by_clause = query.upper().split('GROUP BY')[1].strip()
-            if not group_by_clause:
-                return False, "GROUP BY clause cannot be empty"
-                
-        # Check for proper ORDER BY clause
-        if 'ORDER BY' in query.upper():
-            order_by_clause = query.upper().split('ORDER BY')[1].strip()
-            if not order_by_clause:
-                return False, "ORDER BY clause cannot be empty"
-                
-        return True, "Query is valid"
+        return _validate_sql_query(query)
         
     def check_trino_availability(self):
         """Check if Trino service is available"""
-        try:
-            # Try to execute a simple query to check connection
-            result = self.trino_service.execute_query("SELECT 1")
-            return "error" not in result
-        except Exception as e:
-            print(f"Trino service check failed: {str(e)}")  # Log the error
-            return False
+        expires_at, available = self._trino_availability
+        if time.monotonic() < expires_at:
+            return available
+        available = self.trino_service.ping()
+        self._trino_availability = (time.monotonic() + _availability_ttl(available), available)
+        return available
             
-    def generate_query(self, question, schema_context):
+    async def _passes_validation(self, query: str) -> bool:
+        """Whether Trino parses and analyzes the query (EXPLAIN (TYPE VALIDATE), nothing is run)"""
+        result = await asyncio.to_thread(self.trino_service.execute_query_rows, f"EXPLAIN (TYPE VALIDATE) {query}")
+        return "error" not in result
+
+    async def generate_query(self, question, schema_context):
         """Generate a Trino query from a natural language question"""
-        if not self.check_ollama_availability():
+        if not question.strip():
+            return "SELECT 'Please ask a question' as error"
+        if not schema_context:
+            return "SELECT 'No database schema is available to generate a query from' as error"
+        direct = _direct_query(question, schema_context)
+        # Text that merely looks like SQL must also get past Trino's analyzer, like generated SQL
+        if direct and (direct[0] != "raw_sql" or await self._passes_validation(direct[1])):
+            logger.log_info("ai", "Query generated without the model (%s): %s", *direct)
+            return direct[1]
+        
+        # The same question on the same schema gets the query that already passed validation
+        query_key = (
+            self.model,
+            hashlib.blake2b(schema_context.encode(), digest_size=16).digest(),
+            " ".join(question.split())
+        )
+        cached_query = self._query_cache.get(query_key)
+        if cached_query is not None:
+            return cached_query
+        
+        # Probe both services and recall memories at once; none of them depends on another
+        ollama_available, trino_available, memories = await asyncio.gather(
+            self.check_ollama_availability(),
+            asyncio.to_thread(self.check_trino_availability),
+            asyncio.to_thread(self.memory_service.get_relevant_memories, question)
+        )
+        if not ollama_available:
             return "SELECT 'Ollama service is not available' as message"
             
-        # Check Trino availability first
-        if not self.check_trino_availability():
+        if not trino_available:
             return "SELECT 'Trino service is not available. Please make sure Trino is running.' as error"
             
-        # Get relevant memories
-        memories = self.memory_service.get_relevant_memories(question)
         memory_context = self.memory_service.format_memories_for_prompt(memories)
+        prompt_values = {
+            "question": question,
+            "schema_context": schema_context,
+            "memory_context": memory_context
+        }
         
-        prompt = f"""
-        Given the following question: "{question}"
-        
-        Here is the database schema information:
-        {schema_context}
-        
-        {memory_context}
-        
-        Generate a valid Trino SQL query that would answer this question.
-        Important rules for Trino SQL:
-        1. Use standard SQL syntax
-        2. NEVER use ':' character in any part of the query
-        3. Use proper table aliases (e.g., t1, t2) for joins
-        4. Use standard SQL operators (=, <, >, etc.)
-        5. Use proper date/time functions (e.g., DATE_TRUNC, DATE_ADD)
-        6. Use proper string functions (e.g., CONCAT, SUBSTRING)
-        7. Use proper aggregation functions (e.g., COUNT, SUM, AVG)
-        8. Use proper window functions if needed (e.g., ROW_NUMBER, RANK)
-        9. Use proper JOIN syntax (INNER JOIN, LEFT JOIN, etc.)
-        10. Use proper WHERE clause syntax
-        11. Do not use any special characters except standard SQL operators
-        12. Use proper column aliases without special characters
-        13. Do not use JSON or array syntax
-        14. Do not use any special formatting
-        
-        Return only the SQL query without any explanation or comments.
-        """
+        prompt = _SQL_PROMPT.format_map(prompt_values)
+        retry_prompt = _SQL_SIMPLER_PROMPT.format_map(prompt_values)
         
-        query = self.query_model(prompt, "sql_generation")
-        print(f"Generated initial query: {query}")  # Log the initial query
+        # The simpler fallback doesn't depend on the first answer, so ask for both at once
+        query, retry_query = await asyncio.gather(
+            self._generate_sql_text(prompt),
+            self.query_model(retry_prompt)
+        )
+        logger.log_info("ai", "Generated initial query: %s", query)
         
         # Clean up the query
         query = query.strip()
@@ -397,84 +840,58 @@ class AIService:
         if query.endswith("```"):
             query = query[:-3]
         query = query.strip()
-        print(f"Cleaned query: {query}")  # Log the cleaned query
+        logger.log_info("ai", "Cleaned query: %s", query)
         
         # Additional validation to ensure no ':' character is present
         if ':' in query:
-            print(f"Query contains invalid ':' character: {query}")  # Log the invalid query
-            # Try to generate a simpler query without special characters
-            retry_prompt = f"""
-            The previous query contained invalid characters. Please generate a new query that:
-            1. Uses only basic SELECT, FROM, WHERE clauses
-            2. Uses no special characters (especially ':')
-            3. Uses simple column aliases (e.g., col1, col2)
-            4. Uses standard SQL operators only
-            5. Does not use any JSON or array syntax
-            6. Does not use any special formatting
-            
-            Original question: "{question}"
-            Schema: {schema_context}
-            """
-            
-            query = self.query_model(retry_prompt, "sql_generation")
-            query = query.strip()
-            print(f"Retry generated query: {query}")  # Log the retry query
+            logger.log_info("ai", "Query contains invalid ':' character: %s", query)
+            # Fall back to the simpler query generated alongside it
+            query = retry_query.strip()
+            logger.log_info("ai", "Retry generated query: %s", query)
             
             # Final check for ':' character
             if ':' in query:
-                print(f"Retry query still contains ':' character: {query}")  # Log the invalid retry query
+                logger.log_info("ai", "Retry query still contains ':' character: %s", query)
                 return "SELECT 'Invalid query: Query contains unsupported characters' as error"
         
         # Try to execute the query in Trino to validate it
         try:
-            # Execute with LIMIT 1 to test the query without fetching all results
-            test_query = f"WITH test_query AS ({query}) SELECT * FROM test_query LIMIT 1"
-            print(f"Test query to be executed: {test_query}")  # Log the test query
+            # Have Trino parse and analyze the query without planning or running it
+            test_query = f"EXPLAIN (TYPE VALIDATE) {query}"
+            logger.log_info("ai", "Test query to be executed: %s", test_query)
             
             try:
-                result = self.trino_service.execute_query(test_query)
+                result = await asyncio.to_thread(self.trino_service.execute_query_rows, test_query)
                 
                 if "error" in result:
-                    print(f"Query execution failed with error: {result['error']}")  # Log the error
+                    logger.log_error("ai", "Query execution failed", result['error'])
                     # If the query fails, try to generate a simpler query
-                    retry_prompt = f"""
-                    The previous query failed in Trino with error: {result['error']}
-                    Please generate a simpler query that follows these rules:
-                    1. Use only basic SELECT, FROM, WHERE clauses
-                    2. No complex joins or subqueries
-                    3. No special characters (especially ':')
-                    4. No comments
-                    5. Make sure all table and column names exist in the schema
-                    6. Do not use any JSON or array syntax
-                    7. Do not use any special formatting
+                    retry_prompt = _SQL_AFTER_ERROR_PROMPT.format_map(dict(prompt_values, error=result['error']))
                     
-                    Original question: "{question}"
-                    Schema: {schema_context}
-                    """
-                    
-                    query = self.query_model(retry_prompt, "sql_generation")
+                    query = await self.query_model(retry_prompt)
                     query = query.strip()
-                    print(f"Second retry generated query: {query}")  # Log the second retry query
+                    logger.log_info("ai", "Second retry generated query: %s", query)
                     
                     # Try the simpler query
-                    test_query = f"WITH test_query AS ({query}) SELECT * FROM test_query LIMIT 1"
-                    print(f"Second test query to be executed: {test_query}")  # Log the second test query
-                    result = self.trino_service.execute_query(test_query)
+                    test_query = f"EXPLAIN (TYPE VALIDATE) {query}"
+                    logger.log_info("ai", "Second test query to be executed: %s", test_query)
+                    result = await asyncio.to_thread(self.trino_service.execute_query_rows, test_query)
                     
                     if "error" in result:
-                        print(f"Second query execution failed with error: {result['error']}")  # Log the error
+                        logger.log_error("ai", "Second query execution failed", result['error'])
                         return f"SELECT 'Invalid query generated: {result['error']}' as error"
                 
             except Exception as query_error:
-                print(f"Query execution failed: {str(query_error)}")  # Log the error
+                logger.log_error("ai", "Query execution failed", query_error)
                 return f"SELECT 'Error executing query: {str(query_error)}' as error"
                 
         except Exception as trino_error:
-            print(f"Trino service error: {str(trino_error)}")  # Log the error
+            logger.log_error("ai", "Trino service error", trino_error)
             return f"SELECT 'Trino service error: {str(trino_error)}' as error"
         
-        # Store the conversation
-        self.memory_service.store_conversation(
+        # Store the conversation in the background; the caller doesn't need the write
+        self._write_in_background(
+            self.memory_service.store_conversation,
             question=question,
             response=query,
             metadata={
@@ -485,39 +902,5 @@ class AIService:
             }
         )
         
+        self._query_cache[query_key] = query
         return query
-    
-    def analyze_results(self, question, schema_context, results):
-        """Analyze query results with AI"""
-        if not self.check_ollama_availability():
-            return "Ollama service is not available. Please make sure Ollama is running and try again."
-            
-        # Get relevant memories
-        memories = self.memory_service.get_relevant_memories(question)
-        memory_context = self.memory_service.format_memories_for_prompt(memories)
-        
-        prompt = f"""
-        Given the question: "{question}"
-        The database schema: {schema_context}
-        And the query results: {json.dumps(results, default=str)}
-        
-        {memory_context}
-        
-        Please provide a detailed analysis of these results in natural language.
-        Consider relationships between values, patterns, outliers, and significance of the findings.
-        """
-        
-        analysis = self.query_model(prompt, "result_analysis")
-        
-        # Store the conversation
-        self.memory_service.store_conversation(
-            question=question,
-            response=analysis,
-            metadata={
-                "type": "result_analysis",
-                "schema_context": schema_context,
-                "results": results
-            }
-        )
-        
-        return analysis
\ No newline at end of file
@@ -1,7 +1,18 @@
 from fastapi import HTTPException
 from app.logging.logger import log_error
-import traceback
 from typing import Dict, Any, Optional
+from jinja2 import Environment
+from markupsafe import escape
+
+# Compiled once; autoescape keeps error messages and context values from injecting markup
+_ERROR_TEMPLATE = Environment(autoescape=True).from_string("""
+            <div class="error-container">
+                <h3>Error: {{ info.type }}</h3>
+                <p><strong>Message:</strong> {{ info.message }}</p>
+                <p><strong>Details:</strong> {{ info.detail }}</p>
+                {% if info.context %}<p><strong>Context:</strong></p><ul>{% for key, value in info.context.items() %}<li><strong>{{ key }}:</strong> {{ value }}</li>{% endfor %}</ul>{% endif %}
+            </div>
+            """)
 
 class ErrorService:
     def __init__(self):
@@ -41,12 +52,8 @@ class ErrorService:
                 "message": "An unexpected error occurred"
             })
             
-            # Log the error
-            log_error(
-                error_type,
-                f"Error: {str(error)}\nContext: {context}\nTraceback: {traceback.format_exc()}",
-                error
-            )
+            # Log the error; log_error attaches the exception's own traceback when the record is written
+            log_error(error_type, f"Error: {error}\nContext: {context}", error)
             
             # Create error response
             error_response = {
@@ -81,24 +88,5 @@ class ErrorService:
         """Format error for display in the UI"""
         error_detail = error.detail
         if isinstance(error_detail, dict) and "error" in error_detail:
-            error_info = error_detail["error"]
-            return f"""
-            <div class="error-container">
-                <h3>Error: {error_info['type']}</h3>
-                <p><strong>Message:</strong> {error_info['message']}</p>
-                <p><strong>Details:</strong> {error_info['detail']}</p>
-                {self._format_context(error_info.get('context', {}))}
-            </div>
-            """
-        return str(error_detail)
-        
-    def _format_context(self, context: Dict[str, Any]) -> str:
-        """Format context information for display"""
-        if not context:
-            return ""
-            
-        context_html = "<p><strong>Context:</strong></p><ul>"
-        for key, value in context.items():
-            context_html += f"<li><strong>{key}:</strong> {value}</li>"
-        context_html += "</ul>"
-        return context_html 
\ No newline at end of file
+            return _ERROR_TEMPLATE.render(info=error_detail["error"])
+        return str(escape(error_detail))
@@ -1,12 +1,34 @@
 import bcrypt
+import hashlib
 import jwt
+import orjson
+from cachetools import LRUCache, TTLCache
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
-from app.core.logging import logger
-from app.config import settings
-import json
+from app.logging.logger import logger
+from app.config.settings import settings
+import os
+import threading
 from pathlib import Path
 
+# bcrypt only uses the first 72 bytes, so longer passwords are refused when set
+MAX_PASSWORD_BYTES = 72
+
+def _hash_password(password: str) -> str:
+    """Hash a password with the configured bcrypt cost"""
+    return bcrypt.hashpw(
+        password.encode('utf-8'),
+        bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
+    ).decode('utf-8')
+
+def _needs_rehash(hashed_password: str) -> bool:
+    """Whether a bcrypt hash ($2b$<rounds>$...) was made with a different cost"""
+    return int(hashed_password.split('$')[2]) != settings.BCRYPT_ROUNDS
+
+def _is_settable_password(password: str) -> bool:
+    return 0 < len(password.encode('utf-8')) <= MAX_PASSWORD_BYTES
+
 class IAMService:
     def __init__(self):
         # Get the application root directory
@@ -16,6 +38,15 @@ class IAMService:
         self.users_dir = app_root / "data" / "users"
         self.users_dir.mkdir(parents=True, exist_ok=True)
         
+        # Parsed user records keyed by username, with the file mtime they were read at
+        self._user_cache = LRUCache(maxsize=1024)
+        # cachetools caches aren't thread-safe; logins run in worker threads next to token checks
+        self._user_cache_lock = threading.Lock()
+        
+        # Recently rejected passwords, keyed by the stored hash so a password change forgets them
+        self._failed_logins = TTLCache(maxsize=10000, ttl=30)
+        self._failed_logins_lock = threading.Lock()
+        
         # Load permissions
         self._load_permissions()
         
@@ -37,11 +68,52 @@ class IAMService:
                 "edit": ["admin"]
             }
         }
+        # One hash lookup per check; the table is fixed after loading
+        self._permission_index = frozenset(
+            (resource, action, role)
+            for resource, actions in self.permissions.items()
+            for action, roles in actions.items()
+            for role in roles
+        )
         
     def _get_user_file(self, username: str) -> Path:
         """Get user file path"""
         return self.users_dir / f"{username}.json"
         
+    def _load_user(self, username: str) -> Optional[Dict]:
+        """Load a user record, reusing the parsed file until it changes on disk"""
+        user_file = self._get_user_file(username)
+        try:
+            mtime = user_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._user_cache_lock:
+            cached = self._user_cache.get(username)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, orjson.loads(user_file.read_bytes()))
+            with self._user_cache_lock:
+                self._user_cache[username] = cached
+        # Callers modify the record, so hand out a copy
+        return dict(cached[1])
+        
+    def _save_user(self, username: str, user_data: Dict) -> None:
+        """Write a user record atomically so readers never see a partial file"""
+        user_file = self._get_user_file(username)
+        tmp_file = user_file.with_suffix(".json.tmp")
+        tmp_file.write_bytes(orjson.dumps(user_data))
+        os.replace(tmp_file, user_file)
+        
+    def _get_last_login_file(self, username: str) -> Path:
+        """Get the sidecar file holding the user's last login time"""
+        return self.users_dir / f"{username}.lastlogin"
+        
+    def _with_last_login(self, user_data: Dict) -> Dict:
+        """Merge the last login time from its sidecar file into user data"""
+        last_login_file = self._get_last_login_file(user_data['username'])
+        if last_login_file.exists():
+            user_data['last_login'] = last_login_file.read_text()
+        return user_data
+        
     def create_user(self, username: str, password: str, role: str = "user") -> bool:
         """Create a new user"""
         try:
@@ -49,11 +121,12 @@ class IAMService:
                 logger.log_error("iam", f"User {username} already exists")
                 return False
                 
+            if not _is_settable_password(password):
+                logger.log_error("iam", f"Password for user {username} must be 1-{MAX_PASSWORD_BYTES} bytes")
+                return False
+                
             # Hash password
-            hashed_password = bcrypt.hashpw(
-                password.encode('utf-8'),
-                bcrypt.gensalt()
-            ).decode('utf-8')
+            hashed_password = _hash_password(password)
             
             # Create user data
             user_data = {
@@ -66,8 +139,7 @@ class IAMService:
             }
             
             # Save user data
-            with open(self._get_user_file(username), 'w') as f:
-                json.dump(user_data, f)
+            self._save_user(username, user_data)
                 
             logger.log_auth(f"User {username} created with role {role}")
             return True
@@ -79,27 +151,41 @@ class IAMService:
     def authenticate_user(self, username: str, password: str) -> Optional[Dict]:
         """Authenticate user and return JWT token"""
         try:
-            user_file = self._get_user_file(username)
-            if not user_file.exists():
+            # Don't spend a hash check on a password that can't match
+            if not password:
+                logger.log_error("iam", f"Empty password for user {username}")
+                return None
+                
+            user_data = self._load_user(username)
+            if user_data is None:
                 logger.log_error("iam", f"User {username} not found")
                 return None
                 
-            # Load user data
-            with open(user_file, 'r') as f:
-                user_data = json.load(f)
+            # Repeated wrong passwords are turned away without paying for bcrypt again
+            failed_key = (user_data['password'], hashlib.sha256(password.encode('utf-8')).digest())
+            with self._failed_logins_lock:
+                recently_failed = failed_key in self._failed_logins
+            if recently_failed:
+                logger.log_error("iam", f"Invalid password for user {username}")
+                return None
                 
             # Check password
             if not bcrypt.checkpw(
                 password.encode('utf-8'),
                 user_data['password'].encode('utf-8')
             ):
+                with self._failed_logins_lock:
+                    self._failed_logins[failed_key] = True
                 logger.log_error("iam", f"Invalid password for user {username}")
                 return None
                 
-            # Update last login
-            user_data['last_login'] = datetime.now().isoformat()
-            with open(user_file, 'w') as f:
-                json.dump(user_data, f)
+            # Move the stored hash to the configured cost while the plain password is at hand
+            if _needs_rehash(user_data['password']):
+                user_data['password'] = _hash_password(password)
+                self._save_user(username, user_data)
+                
+            # Record the login in a sidecar so the user file is only rewritten on real changes
+            self._get_last_login_file(username).write_text(datetime.now().isoformat())
                 
             # Generate JWT token
             token = jwt.encode(
@@ -129,30 +215,26 @@ class IAMService:
             if not token:
                 raise Exception("[IAM Layer] Token is empty (Component: Token Validator)")
                 
+            # PyJWT checks exp itself and raises ExpiredSignatureError
             payload = jwt.decode(
                 token,
                 settings.JWT_SECRET_KEY,
-                algorithms=[settings.JWT_ALGORITHM]
+                algorithms=[settings.JWT_ALGORITHM],
+                options={"require": ["exp", "username", "role"]}
             )
-            
-            # Check if token is expired
-            if datetime.utcnow() > datetime.fromtimestamp(payload['exp']):
-                raise Exception("[IAM Layer] Token has expired (Component: Token Validator)")
                 
             # Get user data
-            user_file = self._get_user_file(payload['username'])
-            if not user_file.exists():
+            user_data = self._load_user(payload['username'])
+            if user_data is None:
                 raise Exception(f"[IAM Layer] User {payload['username']} not found (Component: User Manager)")
                 
-            with open(user_file, 'r') as f:
-                user_data = json.load(f)
-                
             if not user_data.get('is_active', True):
                 raise Exception(f"[IAM Layer] User {payload['username']} is not active (Component: User Manager)")
                 
             return {
                 "username": payload['username'],
-                "role": payload['role']
+                "role": payload['role'],
+                "exp": payload['exp']
             }
             
         except jwt.ExpiredSignatureError:
@@ -164,32 +246,19 @@ class IAMService:
             
     def check_permission(self, user_role: str, resource: str, action: str) -> bool:
         """Check if user has permission for action on resource"""
-        try:
-            if resource not in self.permissions:
-                logger.log_error("iam", f"Resource {resource} not found in permissions")
-                return False
-                
-            if action not in self.permissions[resource]:
-                logger.log_error("iam", f"Action {action} not found in permissions for {resource}")
-                return False
-                
-            return user_role in self.permissions[resource][action]
-            
-        except Exception as e:
-            logger.log_error("iam", f"Error checking permission for {user_role} on {resource}", e)
-            return False
+        return (resource, action, user_role) in self._permission_index
             
     def update_password(self, username: str, old_password: str, new_password: str) -> bool:
         """Update user password"""
         try:
-            user_file = self._get_user_file(username)
-            if not user_file.exists():
+            user_data = self._load_user(username)
+            if user_data is None:
                 logger.log_error("iam", f"User {username} not found")
                 return False
                 
-            # Load user data
-            with open(user_file, 'r') as f:
-                user_data = json.load(f)
+            if not _is_settable_password(new_password):
+                logger.log_error("iam", f"New password for user {username} must be 1-{MAX_PASSWORD_BYTES} bytes")
+                return False
                 
             # Verify old password
             if not bcrypt.checkpw(
@@ -200,14 +269,10 @@ class IAMService:
                 return False
                 
             # Update password
-            user_data['password'] = bcrypt.hashpw(
-                new_password.encode('utf-8'),
-                bcrypt.gensalt()
-            ).decode('utf-8')
+            user_data['password'] = _hash_password(new_password)
             
             # Save updated user data
-            with open(user_file, 'w') as f:
-                json.dump(user_data, f)
+            self._save_user(username, user_data)
                 
             logger.log_auth(f"Password updated for user {username}")
             return True
@@ -219,33 +284,36 @@ class IAMService:
     def get_user(self, username: str) -> Optional[Dict]:
         """Get user data"""
         try:
-            user_file = self._get_user_file(username)
-            if not user_file.exists():
+            user_data = self._load_user(username)
+            if user_data is None:
                 logger.log_error("iam", f"User {username} not found")
                 return None
                 
-            with open(user_file, 'r') as f:
-                user_data = json.load(f)
-                
             # Remove sensitive data
             user_data.pop('password', None)
-            return user_data
+            return self._with_last_login(user_data)
             
         except Exception as e:
             logger.log_error("iam", f"Error getting user {username}", e)
             return None
             
+    def _load_public_user(self, username: str) -> Optional[Dict]:
+        """Load a user record without sensitive data"""
+        user_data = self._load_user(username)
+        if user_data is None:
+            return None
+        user_data.pop('password', None)
+        return self._with_last_login(user_data)
+            
     def list_users(self) -> List[Dict]:
         """List all users"""
         try:
-            users = []
-            for user_file in self.users_dir.glob("*.json"):
-                with open(user_file, 'r') as f:
-                    user_data = json.load(f)
-                    # Remove sensitive data
-                    user_data.pop('password', None)
-                    users.append(user_data)
-            return users
+            usernames = [user_file.stem for user_file in self.users_dir.glob("*.json")]
+            if not usernames:
+                return []
+            # Per-user stats and reads are independent, so overlap their I/O
+            with ThreadPoolExecutor(max_workers=min(32, len(usernames))) as executor:
+                return [user for user in executor.map(self._load_public_user, usernames) if user is not None]
             
         except Exception as e:
             logger.log_error("iam", "Error listing users", e)
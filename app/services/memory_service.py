@@ -1,13 +1,42 @@
+import atexit
 import chromadb
+import functools
 from chromadb.config import Settings
-from app.config import settings
-from app.logging.logger import log_error
-import json
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+from app.config.settings import settings
+from app.logging.logger import log_error, logger
+import hashlib
+import orjson
 from datetime import datetime
+import threading
 import time
+import uuid
 import os
 from pathlib import Path
 
+# Cosine distance under which two questions count as the same (similarity >= 0.95)
+RESPONSE_CACHE_MAX_DISTANCE = 0.05
+# Cached replies kept (least recently used go first) and seconds an unused reply stays valid
+RESPONSE_CACHE_MAX_ENTRIES = 2048
+RESPONSE_CACHE_TTL = 24 * 3600
+
+# HNSW index settings for both collections; M and construction_ef only apply when a collection is created
+HNSW_PARAMS = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 24,
+    "hnsw:construction_ef": 128,
+    "hnsw:search_ef": 80,
+    "hnsw:batch_size": 200,
+    "hnsw:num_threads": os.cpu_count() or 1
+}
+
+# Queued conversations are written once this many are waiting or this many seconds have passed
+FLUSH_THRESHOLD = 64
+FLUSH_INTERVAL = 1.0
+
+# Seconds before get_memory_stats re-reads the exact collection count
+STATS_REFRESH_INTERVAL = 30
+
 class MemoryService:
     def __init__(self):
         # Get the application root directory
@@ -17,7 +46,7 @@ class MemoryService:
         self.memory_dir = app_root / "memory_db"
         self.memory_dir.mkdir(exist_ok=True)
         
-        print(f"Memory directory: {self.memory_dir}")  # Log the memory directory path
+        logger.log_info("memory", "Memory directory: %s", self.memory_dir)
         
         # Initialize ChromaDB with persistence
         self.client = chromadb.PersistentClient(
@@ -28,52 +57,81 @@ class MemoryService:
             )
         )
         
+        # One embedder for both collections; question embeddings are memoized since questions repeat
+        self.embedding_function = DefaultEmbeddingFunction()
+        self._embed = functools.lru_cache(maxsize=1024)(self._compute_embedding)
+        
         # Get or create the collection with proper configuration
         self.collection = self.client.get_or_create_collection(
             name="conversation_memory",
+            embedding_function=self.embedding_function,
             metadata={
-                "hnsw:space": "cosine",
+                **HNSW_PARAMS,
                 "description": "Stores conversation history and context"
             }
         )
         
+        # Model replies indexed by the question that produced them, for near-duplicate lookups
+        self.response_cache = self.client.get_or_create_collection(
+            name="response_cache",
+            embedding_function=self.embedding_function,
+            metadata={
+                **HNSW_PARAMS,
+                "description": "Caches model replies by the question they answered"
+            }
+        )
+        
+        self._stats_refreshed_at = 0.0
+        self._response_cache_lock = threading.Lock()
+        self._response_cache_count = self.response_cache.count()
+        
+        # Conversations waiting to be added in one batch
+        self._pending_docs, self._pending_meta, self._pending_ids = [], [], []
+        self._pending_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
+        
         # Initialize memory stats
         self._update_memory_stats()
         
+    def _compute_embedding(self, text):
+        return self.embedding_function([text])[0]
+        
     def _update_memory_stats(self):
         """Update memory statistics"""
         try:
             self.memory_count = self.collection.count()
             self.last_updated = datetime.now()
+            self._stats_refreshed_at = time.monotonic()
         except Exception as e:
             log_error("memory_service", f"Error updating memory stats: {str(e)}", e)
             self.memory_count = 0
             self.last_updated = None
             
     def store_conversation(self, question, response, metadata=None):
-        """Store a conversation in the vector database"""
+        """Queue a conversation for the vector database (written in batches)"""
         try:
             # Convert metadata to string if it's a dict
             if isinstance(metadata, dict):
-                metadata = json.dumps(metadata)
+                metadata = orjson.dumps(metadata, default=str).decode()
                 
-            # Generate a unique ID with timestamp
-            conversation_id = f"conv_{int(time.time())}_{self.memory_count}"
-            
-            # Store the conversation
-            self.collection.add(
-                documents=[response],
-                metadatas=[{
+            with self._pending_lock:
+                conversation_id = f"conv_{uuid.uuid4().hex}"
+                self._pending_docs.append(response)
+                now = datetime.now()
+                self._pending_meta.append({
                     "question": question,
                     "metadata": metadata or "",
-                    "timestamp": str(datetime.now()),
+                    "timestamp": str(now),
+                    "timestamp_epoch": int(now.timestamp()),
                     "type": "conversation"
-                }],
-                ids=[conversation_id]
-            )
+                })
+                self._pending_ids.append(conversation_id)
+                due = (len(self._pending_ids) >= FLUSH_THRESHOLD
+                       or time.monotonic() - self._last_flush >= FLUSH_INTERVAL)
             
-            # Update memory stats
-            self._update_memory_stats()
+            if due:
+                self.flush()
             
             return conversation_id
         except Exception as e:
@@ -81,11 +139,33 @@ class MemoryService:
             log_error("memory_service", error_msg, e)
             raise
             
+    def flush(self):
+        """Write queued conversations to the collection in one batch"""
+        with self._pending_lock:
+            self._last_flush = time.monotonic()
+            if not self._pending_ids:
+                return
+            documents, metadatas, ids = self._pending_docs, self._pending_meta, self._pending_ids
+            self._pending_docs, self._pending_meta, self._pending_ids = [], [], []
+            
+        try:
+            self.collection.add(documents=documents, metadatas=metadatas, ids=ids)
+            # Counted locally; the exact count is re-read by get_memory_stats
+            self.memory_count += len(ids)
+            self.last_updated = datetime.now()
+        except Exception as e:
+            log_error("memory_service", f"Error storing {len(ids)} conversations: {str(e)}", e)
+            
     def get_relevant_memories(self, question, n_results=3):
         """Retrieve relevant past conversations"""
         try:
+            # Queued conversations should be searchable too
+            self.flush()
+            if self.memory_count <= 0:
+                # Nothing stored yet; Chroma rejects n_results=0
+                return []
             results = self.collection.query(
-                query_texts=[question],
+                query_embeddings=[self._embed(question)],
                 n_results=min(n_results, self.memory_count),  # Ensure we don't request more than available
                 where={"type": "conversation"}  # Only get conversations
             )
@@ -97,7 +177,9 @@ class MemoryService:
                         "id": results['ids'][0][i],
                         "question": meta["question"],
                         "response": doc,
-                        "metadata": json.loads(meta["metadata"]) if meta["metadata"] else None,
+                        "metadata": orjson.loads(meta["metadata"]) if meta.get("metadata") else None,
+                        # Stored JSON text, reused as-is when the memory goes into a prompt
+                        "metadata_json": meta.get("metadata") or None,
                         "timestamp": meta["timestamp"]
                     })
                 except Exception as e:
@@ -114,37 +196,133 @@ class MemoryService:
         if not memories:
             return ""
             
-        formatted = "\nRelevant past conversations:\n"
+        parts = ["\nRelevant past conversations:\n"]
         for i, memory in enumerate(memories, 1):
-            formatted += f"\n{i}. Question: {memory['question']}\n"
-            formatted += f"   Response: {memory['response']}\n"
+            parts.append(f"\n{i}. Question: {memory['question']}\n")
+            parts.append(f"   Response: {memory['response']}\n")
             if memory['metadata']:
-                formatted += f"   Context: {json.dumps(memory['metadata'])}\n"
-            formatted += f"   Time: {memory['timestamp']}\n"
+                context = memory.get('metadata_json') or orjson.dumps(memory['metadata'], default=str).decode()
+                parts.append(f"   Context: {context}\n")
+            parts.append(f"   Time: {memory['timestamp']}\n")
                 
-        return formatted
+        return "".join(parts)
+        
+    def find_cached_response(self, kind, text):
+        """Return a stored model reply of the given kind for a near-identical text, if any"""
+        try:
+            if self._response_cache_count <= 0:
+                return None
+            now = int(time.time())
+            results = self.response_cache.query(
+                query_embeddings=[self._embed(text)],
+                n_results=1,
+                where={"$and": [{"kind": kind}, {"used_at": {"$gte": now - RESPONSE_CACHE_TTL}}]},
+                include=["metadatas", "distances"]
+            )
+            if results['distances'][0] and results['distances'][0][0] <= RESPONSE_CACHE_MAX_DISTANCE:
+                metadata = results['metadatas'][0][0]
+                # Refresh recency so frequently reused replies survive eviction
+                self.response_cache.update(ids=[results['ids'][0][0]], metadatas=[{**metadata, "used_at": now}])
+                return metadata["response"]
+        except Exception as e:
+            log_error("memory_service", f"Error looking up cached response: {str(e)}", e)
+        return None
         
+    def cache_response(self, kind, text, response):
+        """Store a model reply of the given kind for later near-duplicate lookups"""
+        try:
+            self.response_cache.upsert(
+                ids=[hashlib.blake2b(f"{kind}\0{text}".encode(), digest_size=16).hexdigest()],
+                documents=[text],
+                metadatas=[{"kind": kind, "response": response, "used_at": int(time.time())}]
+            )
+            with self._response_cache_lock:
+                # Upserts of an existing id overcount; the exact count is re-read when evicting
+                self._response_cache_count += 1
+                if self._response_cache_count > RESPONSE_CACHE_MAX_ENTRIES:
+                    self._evict_responses()
+        except Exception as e:
+            log_error("memory_service", f"Error caching response: {str(e)}", e)
+            
+    def _evict_responses(self):
+        """Drop expired replies, then the least recently used, down to 90% of the cap"""
+        entries = self.response_cache.get(include=["metadatas"])
+        expired_before = int(time.time()) - RESPONSE_CACHE_TTL
+        by_recency = sorted(
+            zip(entries['ids'], (meta.get("used_at", 0) for meta in entries['metadatas'])),
+            key=lambda entry: entry[1]
+        )
+        keep = RESPONSE_CACHE_MAX_ENTRIES * 9 // 10
+        stale = [entry_id for i, (entry_id, used_at) in enumerate(by_recency)
+                 if used_at < expired_before or i < len(by_recency) - keep]
+        if stale:
+            self.response_cache.delete(ids=stale)
+        self._response_cache_count = len(by_recency) - len(stale)
+        
+    def clear_response_cache(self):
+        """Forget every cached model reply (e.g. after the schema they describe changed)"""
+        try:
+            with self._response_cache_lock:
+                ids = self.response_cache.get(include=[])['ids']
+                if ids:
+                    self.response_cache.delete(ids=ids)
+                self._response_cache_count = 0
+        except Exception as e:
+            log_error("memory_service", f"Error clearing cached responses: {str(e)}", e)
+            
     def get_memory_stats(self):
         """Get memory statistics"""
+        if time.monotonic() - self._stats_refreshed_at > STATS_REFRESH_INTERVAL:
+            self._update_memory_stats()
         return {
             "total_memories": self.memory_count,
             "last_updated": self.last_updated.isoformat() if self.last_updated else None,
             "memory_directory": str(self.memory_dir)
         }
         
-    def cleanup_old_memories(self, days_to_keep=30):
+    def _backfill_timestamp_epoch(self, batch_size=500):
+        """Add the numeric timestamp to conversations stored before it existed (runs once)"""
+        marker = self.memory_dir / ".timestamp_epoch_backfilled"
+        if marker.exists():
+            return
+        offset = 0
+        while True:
+            batch = self.collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            ids, metadatas = [], []
+            for memory_id, meta in zip(batch["ids"], batch["metadatas"]):
+                if "timestamp_epoch" not in meta and meta.get("timestamp"):
+                    ids.append(memory_id)
+                    metadatas.append({**meta, "timestamp_epoch": int(datetime.fromisoformat(meta["timestamp"]).timestamp())})
+            if ids:
+                self.collection.update(ids=ids, metadatas=metadatas)
+            offset += batch_size
+        marker.touch()
+        
+    def cleanup_old_memories(self, days_to_keep=30, batch_size=1000):
         """Clean up old memories"""
         try:
+            self._backfill_timestamp_epoch()
             cutoff_time = time.time() - (days_to_keep * 24 * 60 * 60)
-            old_memories = self.collection.get(
-                where={"timestamp": {"$lt": str(datetime.fromtimestamp(cutoff_time))}}
-            )
-            
-            if old_memories and old_memories['ids']:
-                self.collection.delete(ids=old_memories['ids'])
-                self._update_memory_stats()
+            deleted = 0
+            # Page through ids only; deleted rows drop out of the filter, so no offset is needed
+            while True:
+                batch = self.collection.get(
+                    where={"timestamp_epoch": {"$lt": int(cutoff_time)}},
+                    limit=batch_size,
+                    include=[]
+                )
+                if not batch['ids']:
+                    break
+                self.collection.delete(ids=batch['ids'])
+                deleted += len(batch['ids'])
+                
+            if deleted:
+                self.memory_count = max(0, self.memory_count - deleted)
+                self.last_updated = datetime.now()
                 
-            return len(old_memories['ids']) if old_memories else 0
+            return deleted
         except Exception as e:
             error_msg = f"Error cleaning up old memories: {str(e)}"
             log_error("memory_service", error_msg, e)
@@ -1,75 +1,153 @@
+import orjson
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
 import trino
-from app.config import settings
+from app.config.settings import settings
 from app.logging.logger import log_trino_query, log_trino_result, log_error
 
+# Every column of a catalog, ordered so each schema and table arrives as one contiguous run
+COLUMNS_QUERY = """
+    SELECT table_schema, table_name, column_name, data_type, extra_info, comment
+    FROM "{catalog}".information_schema.columns
+    WHERE table_schema <> 'information_schema'
+    ORDER BY table_schema, table_name, ordinal_position
+"""
+
+# Share of the TTL after which the schema is refreshed in the background while still served
+SCHEMA_REFRESH_AHEAD = 0.8
+# Multiple of the TTL after which callers wait for a reload instead of getting the old schema
+SCHEMA_HARD_EXPIRY = 2
+
 class SchemaService:
     def __init__(self, trino_service):
         self.trino_service = trino_service
         self.schema_cache = {}
         self.last_cache_update = 0
+        self.schema_version = 0
+        self._formatted_schema = (None, "")
+        self._refresh_lock = threading.Lock()  # Held while a background refresh is running
+        self._update_lock = threading.Lock()  # Serializes reloads so only one runs at a time
+        
+        # Schema snapshot kept across restarts, tied to the Trino cluster it came from
+        app_root = Path(__file__).parent.parent.parent
+        self._cache_path = app_root / ".cache" / "schema_cache.json"
+        self._fingerprint = [settings.TRINO_HOST, settings.TRINO_PORT, settings.TRINO_USER]
+        self._load_persisted_schema()
+        
+    def _load_persisted_schema(self):
+        """Start from the schema saved by an earlier run if it is still fresh"""
+        try:
+            with open(self._cache_path, "rb") as f:
+                snapshot = orjson.loads(f.read())
+            fingerprint, updated_at, schema = snapshot["fingerprint"], snapshot["updated_at"], snapshot["schema"]
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            log_error("schema_service", f"Ignoring unreadable schema cache: {str(e)}", e)
+            return
+        if fingerprint == self._fingerprint and time.time() - updated_at < SCHEMA_HARD_EXPIRY * settings.SCHEMA_CACHE_TTL:
+            self.schema_cache = schema
+            self.last_cache_update = updated_at
+            self.schema_version += 1
+            
+    def _persist_schema(self):
+        """Save the schema snapshot, replacing the previous file atomically"""
+        try:
+            self._cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._cache_path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps({
+                    "fingerprint": self._fingerprint,
+                    "updated_at": self.last_cache_update,
+                    "schema": self.schema_cache
+                }))
+            os.replace(tmp_path, self._cache_path)
+        except Exception as e:
+            log_error("schema_service", f"Error saving schema cache: {str(e)}", e)
         
     def get_schema(self):
         """Get database schema information"""
-        current_time = time.time()
-        if current_time - self.last_cache_update > settings.SCHEMA_CACHE_TTL:
-            self.update_schema_cache()
+        if self._is_hard_expired():
+            with self._update_lock:
+                # Another caller may have reloaded it while we waited
+                if self._is_hard_expired():
+                    self.update_schema_cache()
+        elif (time.time() - self.last_cache_update > SCHEMA_REFRESH_AHEAD * settings.SCHEMA_CACHE_TTL
+              and self._refresh_lock.acquire(blocking=False)):
+            # Refresh in the background (once at a time) while the current schema keeps being served
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
         return self.schema_cache
         
+    def _is_hard_expired(self):
+        return not self.schema_cache or time.time() - self.last_cache_update > SCHEMA_HARD_EXPIRY * settings.SCHEMA_CACHE_TTL
+        
+    def _refresh_in_background(self):
+        try:
+            with self._update_lock:
+                self.update_schema_cache()
+        except Exception:
+            pass  # Already logged; the current schema keeps being served
+        finally:
+            self._refresh_lock.release()
+        
+    def invalidate_schema_cache(self):
+        """Force the next get_schema call to reload the schema"""
+        self.last_cache_update = 0
+        
+    def _fetch_catalog(self, catalog):
+        """Read a catalog's schemas, tables and columns, or None if it can't be read"""
+        schemas, tables, columns = [], {}, {}
+        try:
+            rows = self.trino_service.iter_query(COLUMNS_QUERY.format(catalog=catalog))
+            # Rows are ordered by schema and table, so each group is one contiguous run
+            for schema_name, schema_rows in groupby(rows, key=itemgetter(0)):
+                schemas.append(schema_name)
+                schema_path = f"{catalog}.{schema_name}"
+                tables[schema_path] = []
+                for table, table_rows in groupby(schema_rows, key=itemgetter(1)):
+                    tables[schema_path].append(table)
+                    columns[f"{schema_path}.{table}"] = [
+                        {"name": name, "type": data_type, "extra": extra, "comment": comment}
+                        for _, _, name, data_type, extra, comment in table_rows
+                    ]
+        except Exception as e:
+            log_error("schema_service", f"Error reading schema of catalog {catalog}: {str(e)}", e)
+            return None
+        return schemas, tables, columns
+        
     def update_schema_cache(self):
         """Update the schema cache"""
         try:
             # Get all catalogs
             catalogs_query = "SHOW CATALOGS"
-            catalogs_result = self.trino_service.execute_query(catalogs_query)
+            catalogs_result = self.trino_service.execute_query_rows(catalogs_query)
             
             if "error" in catalogs_result:
                 raise Exception(catalogs_result["error"])
                 
-            catalogs = [row["Catalog"] for row in catalogs_result["results"]]
+            catalogs = [row[0] for row in catalogs_result["rows"]]
             
-            # Get schemas for each catalog
+            # One information_schema query per catalog instead of SHOW/DESCRIBE per schema and table
             schemas = {}
-            for catalog in catalogs:
-                schemas_query = f"SHOW SCHEMAS FROM {catalog}"
-                schemas_result = self.trino_service.execute_query(schemas_query)
-                
-                if "error" in schemas_result:
-                    continue
-                    
-                schemas[catalog] = [row["Schema"] for row in schemas_result["results"]]
-            
-            # Get tables for each schema
             tables = {}
-            for catalog, schema_list in schemas.items():
-                for schema in schema_list:
-                    tables_query = f"SHOW TABLES FROM {catalog}.{schema}"
-                    tables_result = self.trino_service.execute_query(tables_query)
-                    
-                    if "error" in tables_result:
-                        continue
-                        
-                    tables[f"{catalog}.{schema}"] = [row["Table"] for row in tables_result["results"]]
-            
-            # Get columns for each table
             columns = {}
-            for schema_path, table_list in tables.items():
-                for table in table_list:
-                    columns_query = f"DESCRIBE {schema_path}.{table}"
-                    columns_result = self.trino_service.execute_query(columns_query)
-                    
-                    if "error" in columns_result:
-                        continue
-                        
-                    columns[f"{schema_path}.{table}"] = [
-                        {
-                            "name": row["Column"],
-                            "type": row["Type"],
-                            "extra": row["Extra"],
-                            "comment": row["Comment"]
-                        }
-                        for row in columns_result["results"]
-                    ]
+            # Catalogs are independent and latency-bound, so query them concurrently, leaving
+            # half of the connection pool free for user queries while the streams are held
+            workers = max(1, min(8, self.trino_service.pool.size // 2, len(catalogs)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                catalog_results = list(executor.map(self._fetch_catalog, catalogs))
+            
+            for catalog, catalog_result in zip(catalogs, catalog_results):
+                if catalog_result is None:
+                    continue
+                schemas[catalog], catalog_tables, catalog_columns = catalog_result
+                tables.update(catalog_tables)
+                columns.update(catalog_columns)
             
             self.schema_cache = {
                 "catalogs": catalogs,
@@ -79,6 +157,8 @@ class SchemaService:
             }
             
             self.last_cache_update = time.time()
+            self.schema_version += 1
+            self._persist_schema()
             
         except Exception as e:
             error_msg = f"Error updating schema cache: {str(e)}"
@@ -89,26 +169,29 @@ class SchemaService:
         """Format schema information for AI prompt"""
         schema = self.get_schema()
         
-        formatted_schema = "Database Schema Information:\n\n"
+        # Reuse the formatted text until the schema cache is refreshed
+        version, formatted_schema = self._formatted_schema
+        if version == self.schema_version:
+            return formatted_schema
+        
+        parts = ["Database Schema Information:\n\n"]
         
         for catalog in schema["catalogs"]:
-            formatted_schema += f"Catalog: {catalog}\n"
+            parts.append(f"Catalog: {catalog}\n")
             
-            if catalog in schema["schemas"]:
-                for schema_name in schema["schemas"][catalog]:
-                    formatted_schema += f"  Schema: {schema_name}\n"
+            for schema_name in schema["schemas"].get(catalog, ()):
+                parts.append(f"  Schema: {schema_name}\n")
+                
+                schema_path = f"{catalog}.{schema_name}"
+                for table in schema["tables"].get(schema_path, ()):
+                    parts.append(f"    Table: {table}\n")
                     
-                    schema_path = f"{catalog}.{schema_name}"
-                    if schema_path in schema["tables"]:
-                        for table in schema["tables"][schema_path]:
-                            formatted_schema += f"    Table: {table}\n"
-                            
-                            table_path = f"{schema_path}.{table}"
-                            if table_path in schema["columns"]:
-                                for column in schema["columns"][table_path]:
-                                    formatted_schema += f"      Column: {column['name']} ({column['type']})"
-                                    if column["comment"]:
-                                        formatted_schema += f" - {column['comment']}"
-                                    formatted_schema += "\n"
+                    for column in schema["columns"].get(f"{schema_path}.{table}", ()):
+                        if column["comment"]:
+                            parts.append(f"      Column: {column['name']} ({column['type']}) - {column['comment']}\n")
+                        else:
+                            parts.append(f"      Column: {column['name']} ({column['type']})\n")
         
+        formatted_schema = "".join(parts)
+        self._formatted_schema = (self.schema_version, formatted_schema)
         return formatted_schema
\ No newline at end of file
@@ -1,22 +1,38 @@
-import requests
-import chromadb
-from app.config import settings
+from app.config.settings import settings
 from app.logging.logger import log_error
 import time
-import trino
+import asyncio
 from typing import Dict, Any
 from datetime import datetime
-from app.core.logging import logger
+from app.logging.logger import logger
 from app.services.trino_service import TrinoService
 from app.services.memory_service import MemoryService
 from app.services.ai_service import AIService
 
+# Seconds a check result is reused; "down" results expire sooner so recovery shows up quickly
+STATUS_TTL = 3
+DOWN_STATUS_TTL = 1
+# Seconds a single check may take before it is reported as timed out
+STATUS_CHECK_TIMEOUT = 6
+
 class StatusService:
     def __init__(self, trino_service: TrinoService, memory_service: MemoryService, ai_service: AIService):
         self.trino_service = trino_service
         self.memory_service = memory_service
         self.ai_service = ai_service
         self.ollama_url = settings.OLLAMA_API_URL
+        # Check name -> (expires_at, result)
+        self._check_cache: Dict[str, tuple] = {}
+        
+    def _cached_check(self, name: str, check) -> Dict[str, Any]:
+        """Run a blocking status check, reusing its recent result"""
+        expires_at, result = self._check_cache.get(name, (0.0, None))
+        if time.monotonic() < expires_at:
+            return result
+        result = check()
+        ttl = STATUS_TTL if result.get("status") == "running" else DOWN_STATUS_TTL
+        self._check_cache[name] = (time.monotonic() + ttl, result)
+        return result
         
     def check_trino_status(self) -> Dict[str, Any]:
         """Check Trino service status"""
@@ -28,29 +44,19 @@ class StatusService:
                     "message": "Trino service not initialized"
                 }
                 
-            # Try to execute a real query
-            try:
-                result = self.trino_service.execute_query("SHOW CATALOGS")
-                if not result or "error" in result:
-                    logger.log_error("status", "Trino query failed", result.get("error"))
-                    return {
-                        "status": "down",
-                        "message": f"Trino query failed: {result.get('error', 'Unknown error')}"
-                    }
-                
-                logger.log_info("status", "Trino service is running and responding to queries")
-                return {
-                    "status": "running",
-                    "message": "Trino service is running and responding to queries"
-                }
-                
-            except Exception as e:
-                logger.log_error("status", f"Trino query execution error: {str(e)}", e)
+            # Ask the coordinator's REST API rather than submitting a query
+            if not self.trino_service.ping():
+                logger.log_error("status", "Trino coordinator is not responding")
                 return {
                     "status": "down",
-                    "message": f"Trino query execution error: {str(e)}"
+                    "message": "Trino coordinator is not responding"
                 }
                 
+            return {
+                "status": "running",
+                "message": "Trino service is running"
+            }
+            
         except Exception as e:
             logger.log_error("status", f"Trino service check error: {str(e)}", e)
             return {
@@ -82,7 +88,7 @@ class StatusService:
                 "message": f"Memory service is down: {str(e)}"
             }
             
-    def check_ollama_status(self) -> Dict[str, Any]:
+    async def check_ollama_status(self) -> Dict[str, Any]:
         """Check Ollama service status"""
         try:
             if not self.ai_service:
@@ -93,7 +99,7 @@ class StatusService:
                 }
                 
             # Check if Ollama is available
-            is_available = self.ai_service.check_ollama_availability()
+            is_available = await self.ai_service.check_ollama_availability()
             if is_available:
                 logger.log_info("status", "Ollama service is running")
                 return {
@@ -113,17 +119,48 @@ class StatusService:
                 "message": f"Ollama service check error: {str(e)}"
             }
             
-    def get_status(self) -> Dict[str, Any]:
-        """Get status of all services"""
+    def _status_from_result(self, name: str, result: Any) -> Dict[str, Any]:
+        """Turn an exception raised by a status check into a "down" status"""
+        if isinstance(result, asyncio.TimeoutError):
+            logger.log_error("status", f"{name} status check timed out")
+            return {
+                "status": "timeout",
+                "message": f"{name} status check did not finish within {STATUS_CHECK_TIMEOUT}s"
+            }
+        if isinstance(result, BaseException):
+            logger.log_error("status", f"{name} status check failed: {str(result)}", result)
+            return {
+                "status": "down",
+                "message": f"{name} status check failed: {str(result)}"
+            }
+        return result
+            
+    async def get_status(self) -> Dict[str, Any]:
+        """Get status of all services, checking them concurrently"""
         try:
-            trino_status = self.check_trino_status()
-            memory_status = self.check_memory_status()
-            ollama_status = self.check_ollama_status()
+            # A slow backend is reported as timed out instead of holding up the others
+            results = await asyncio.gather(
+                asyncio.wait_for(
+                    asyncio.to_thread(self._cached_check, "trino", self.check_trino_status),
+                    STATUS_CHECK_TIMEOUT
+                ),
+                asyncio.wait_for(
+                    asyncio.to_thread(self._cached_check, "memory", self.check_memory_status),
+                    STATUS_CHECK_TIMEOUT
+                ),
+                asyncio.wait_for(self.check_ollama_status(), STATUS_CHECK_TIMEOUT),
+                return_exceptions=True
+            )
+            trino_status, memory_status, ollama_status = (
+                self._status_from_result(name, result)
+                for name, result in zip(("Trino", "Memory", "Ollama"), results)
+            )
             
             return {
                 "trino": trino_status,
                 "memory": memory_status,
                 "ollama": ollama_status,
+                "response_cache": dict(self.ai_service.response_cache_stats) if self.ai_service else None,
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             }
         except Exception as e:
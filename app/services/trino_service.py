@@ -1,30 +1,247 @@
+import decimal
+import httpx
+import numbers
+import queue
+import requests
+import threading
+import time
 import trino
-from app.config import settings
+from contextlib import contextmanager
+from app.config.settings import settings
 from app.logging.logger import log_error
 
+# Rows fetched per page when streaming results
+STREAM_ARRAYSIZE = 10_000
+# Pause before retrying a query on a fresh connection after the server dropped one
+RECONNECT_BACKOFF = 0.5
+# Seconds to wait for a free pooled connection before giving up on a query
+POOL_ACQUIRE_TIMEOUT = 30
+
+class _ResultSizeSession(requests.Session):
+    """HTTP session that asks Trino for larger result pages when following a query's nextUri"""
+
+    def __init__(self, target_result_size):
+        super().__init__()
+        self.target_result_size = target_result_size
+
+    def get(self, url, **kwargs):
+        # The client has no option for this; the server reads it from the polling URL
+        if "/v1/statement/" in url:
+            kwargs["params"] = {**(kwargs.get("params") or {}), "targetResultSize": self.target_result_size}
+        return super().get(url, **kwargs)
+
+def _connect():
+    """Open a Trino connection with the configured settings"""
+    return trino.dbapi.connect(
+        host=settings.TRINO_HOST,
+        port=settings.TRINO_PORT,
+        user=settings.TRINO_USER,
+        catalog=settings.TRINO_DEFAULT_CATALOG,
+        schema=settings.TRINO_DEFAULT_SCHEMA,
+        http_session=_ResultSizeSession(settings.TRINO_TARGET_RESULT_SIZE) if settings.TRINO_TARGET_RESULT_SIZE else None
+    )
+
+class TrinoPool:
+    """Fixed-size pool of Trino connections, so concurrent queries don't share one connection"""
+
+    def __init__(self, size):
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._discarded = 0
+        for _ in range(size):
+            self._idle.put(_connect())
+            self._created += 1
+
+    @contextmanager
+    def acquire(self, timeout=POOL_ACQUIRE_TIMEOUT):
+        """Borrow a connection; one that lost its server is replaced instead of returned"""
+        try:
+            conn = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No Trino connection became free within {timeout} seconds (pool size {self.size})")
+        if conn is None:
+            # A slot whose replacement couldn't be opened earlier
+            conn = self._replace()
+            if conn is None:
+                self._idle.put(None)
+                raise trino.exceptions.TrinoConnectionError("Could not open a Trino connection")
+        try:
+            yield conn
+        except trino.exceptions.TrinoConnectionError:
+            conn.close()
+            with self._lock:
+                self._discarded += 1
+            # Only a live connection goes back; None keeps the slot until the next borrow reconnects it
+            conn = self._replace()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def _replace(self):
+        """Open a connection for a slot, or return None if that fails"""
+        try:
+            conn = _connect()
+        except Exception as e:
+            log_error("trino_service", f"Failed to open a replacement Trino connection: {str(e)}", e)
+            return None
+        with self._lock:
+            self._created += 1
+        return conn
+
+    def stats(self):
+        """Pool counters for monitoring"""
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "created": self._created,
+            "discarded": self._discarded
+        }
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if conn is not None:
+                conn.close()
+
 class TrinoService:
     def __init__(self):
         try:
-            self.conn = trino.dbapi.connect(
-                host=settings.TRINO_HOST,
-                port=settings.TRINO_PORT,
-                user=settings.TRINO_USER,
-                catalog=settings.TRINO_DEFAULT_CATALOG,
-                schema=settings.TRINO_DEFAULT_SCHEMA
-            )
+            self.pool = TrinoPool(settings.TRINO_POOL_SIZE)
         except Exception as e:
             error_msg = f"Failed to connect to Trino server at {settings.TRINO_HOST}:{settings.TRINO_PORT}. Please check if the server is running and the connection details are correct."
             log_error("trino_service", error_msg, e)
             raise Exception(error_msg)
         
-    def execute_query(self, query):
-        """Execute a Trino SQL query and return results"""
+        # Coordinator REST API, used for cheap liveness checks
+        self._info_client = httpx.Client(
+            base_url=f"http://{settings.TRINO_HOST}:{settings.TRINO_PORT}",
+            timeout=httpx.Timeout(2.0, connect=1.0)
+        )
+        # Open the HTTP connection in the background so the first request doesn't pay for it
+        threading.Thread(target=self._warm_up, name="trino-warm-up", daemon=True).start()
+        
+    def _warm_up(self):
+        """Run a trivial query; the pool is LIFO, so the next query reuses this connection"""
+        self.execute_query_rows("SELECT 1")
+
+    def _run(self, work):
+        """Run work(cursor) on a pooled connection, retrying once on a fresh one if the server dropped it"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(query)
+            with self.pool.acquire() as conn:
+                return work(conn.cursor())
+        except trino.exceptions.TrinoConnectionError:
+            # acquire() already swapped in a new connection
+            time.sleep(RECONNECT_BACKOFF)
+            with self.pool.acquire() as conn:
+                return work(conn.cursor())
+
+    def close(self):
+        """Close the Trino connections"""
+        self.pool.close()
+        self._info_client.close()
+
+    def execute_query_rows(self, query, params=None, max_rows=None):
+        """Execute a Trino SQL query and return column names plus rows as tuples (no per-row dicts)"""
+        def work(cursor):
+            cursor.execute(query, params)
+            columns = [desc[0] for desc in cursor.description]
+            rows = cursor.fetchall() if max_rows is None else cursor.fetchmany(max_rows)
+            return {"columns": columns, "rows": rows}
+
+        try:
+            return self._run(work)
+        except Exception as e:
+            error_msg = f"Failed to execute query. Please check if the Trino server is running and accessible. Error details: {str(e)}"
+            log_error("trino_service", error_msg, e)
+            return {"error": error_msg}
+
+    def summarize_query(self, query, sample_size, params=None):
+        """Execute a query, keeping the first rows plus the row count and numeric column stats"""
+        def work(cursor):
+            cursor.arraysize = STREAM_ARRAYSIZE
+            cursor.execute(query, params)
+            columns = [desc[0] for desc in cursor.description]
+            sample, row_count = [], 0
+            # Column name -> [count, min, max, sum] over its numeric values
+            stats = {}
+            while True:
+                rows = cursor.fetchmany()
+                if not rows:
+                    break
+                if len(sample) < sample_size:
+                    sample.extend(rows[:sample_size - len(sample)])
+                row_count += len(rows)
+                for row in rows:
+                    for name, value in zip(columns, row):
+                        if isinstance(value, bool) or not isinstance(value, (numbers.Real, decimal.Decimal)):
+                            continue
+                        column_stats = stats.get(name)
+                        if column_stats is None:
+                            stats[name] = [1, value, value, float(value)]
+                        else:
+                            column_stats[0] += 1
+                            column_stats[1] = min(column_stats[1], value)
+                            column_stats[2] = max(column_stats[2], value)
+                            column_stats[3] += float(value)
+            return {
+                "columns": columns,
+                "rows": sample,
+                "row_count": row_count,
+                "numeric_columns": {
+                    name: {"min": low, "max": high, "mean": total / count}
+                    for name, (count, low, high, total) in stats.items()
+                }
+            }
+
+        try:
+            return self._run(work)
+        except Exception as e:
+            error_msg = f"Failed to execute query. Please check if the Trino server is running and accessible. Error details: {str(e)}"
+            log_error("trino_service", error_msg, e)
+            return {"error": error_msg}
+
+    def iter_query(self, query, params=None, arraysize=STREAM_ARRAYSIZE):
+        """Execute a Trino SQL query and yield its rows as tuples, one page at a time"""
+        with self.pool.acquire() as conn:
+            cursor = conn.cursor()
+            cursor.arraysize = arraysize
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany()
+                if not rows:
+                    break
+                yield from rows
+
+    def ping(self):
+        """Check that the coordinator is up via /v1/info, without submitting a query"""
+        try:
+            response = self._info_client.get("/v1/info")
+            if response.status_code != 200:
+                return False
+            if response.json().get("starting"):
+                # Still starting up; only a real query tells whether it can serve yet
+                return "error" not in self.execute_query("SELECT 1")
+            return True
+        except Exception as e:
+            log_error("trino_service", f"Trino liveness check failed: {str(e)}", e)
+            return False
+
+    def execute_query(self, query, params=None):
+        """Execute a Trino SQL query and return results (params bind to ? placeholders)"""
+        def work(cursor):
+            cursor.execute(query, params)
             columns = [desc[0] for desc in cursor.description]
             results = [dict(zip(columns, row)) for row in cursor.fetchall()]
             return {"results": results, "columns": columns}
+
+        try:
+            return self._run(work)
         except Exception as e:
             error_msg = f"Failed to execute query. Please check if the Trino server is running and accessible. Error details: {str(e)}"
             log_error("trino_service", error_msg, e)
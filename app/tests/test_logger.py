@@ -0,0 +1,34 @@
+import pytest
+from app.logging import logger
+
+@pytest.fixture
+def log_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(logger, "logs_dir", tmp_path)
+    return tmp_path
+
+def _record(name, message):
+    return f"2024-01-01 00:00:00 - {name} - INFO - {message}"
+
+def test_tail_log_returns_the_last_lines_in_order(log_dir):
+    (log_dir / "prompts.log").write_text("".join(f"line {i}\n" for i in range(10)))
+    assert logger.tail_log("prompts", 3) == [b"line 7", b"line 8", b"line 9"]
+
+def test_tail_log_joins_lines_split_across_blocks(log_dir):
+    lines = [f"{i:03d} " + "x" * (i % 7) for i in range(200)]
+    (log_dir / "prompts.log").write_text("\n".join(lines) + "\n")
+    assert logger.tail_log("prompts", 50, block_size=16) == [line.encode() for line in lines[-50:]]
+
+def test_tail_log_returns_everything_when_asked_for_more_lines(log_dir):
+    (log_dir / "responses.log").write_text("first\n\nsecond")
+    assert logger.tail_log("responses", 100) == [b"first", b"second"]
+
+def test_tail_log_filters_the_shared_app_log_by_logger_name(log_dir):
+    records = [_record("api", "a1"), _record("trino", "t1"), _record("api", "a2"), _record("ai", "x1")]
+    (log_dir / "app.log").write_text("\n".join(records) + "\n")
+    assert logger.tail_log("api", 10) == [records[0].encode(), records[2].encode()]
+    assert logger.tail_log("app", 2) == [records[2].encode(), records[3].encode()]
+
+def test_tail_log_handles_missing_files_and_non_positive_counts(log_dir):
+    assert logger.tail_log("prompts", 10) == []
+    (log_dir / "prompts.log").write_text("line\n")
+    assert logger.tail_log("prompts", 0) == []
@@ -0,0 +1,121 @@
+import asyncio
+import time
+import pytest
+from cachetools import TTLCache
+from app import main
+from app.main import _inflight_calls, _run_coalesced
+
+def test_run_coalesced_shares_one_run_between_concurrent_callers():
+    calls = []
+
+    async def run():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"status": "ok"}
+
+    async def main():
+        results = await asyncio.gather(*(_run_coalesced("key", run) for _ in range(5)))
+        return results, dict(_inflight_calls)
+
+    results, inflight = asyncio.run(main())
+    assert len(calls) == 1
+    assert results == [{"status": "ok"}] * 5
+    assert all(result is results[0] for result in results)
+    assert inflight == {}
+
+def test_run_coalesced_propagates_exceptions_to_every_caller():
+    calls = []
+
+    async def run():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(*(_run_coalesced("key", run) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) and str(result) == "boom" for result in results)
+    assert "key" not in _inflight_calls
+
+def test_run_coalesced_runs_again_once_the_first_call_finished():
+    calls = []
+
+    async def run():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        return await _run_coalesced("key", run), await _run_coalesced("key", run)
+
+    assert asyncio.run(main()) == (1, 2)
+    assert "key" not in _inflight_calls
+
+def test_run_coalesced_keeps_keys_apart():
+    async def main():
+        return await asyncio.gather(
+            _run_coalesced("a", lambda: asyncio.sleep(0.01, result="a")),
+            _run_coalesced("b", lambda: asyncio.sleep(0.01, result="b"))
+        )
+
+    assert asyncio.run(main()) == ["a", "b"]
+    assert _inflight_calls == {}
+
+def test_run_coalesced_clears_the_key_when_cancelled():
+    async def main():
+        task = asyncio.create_task(_run_coalesced("key", lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0)
+        assert "key" in _inflight_calls
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert "key" not in _inflight_calls
+
+@pytest.fixture
+def verify_calls(monkeypatch):
+    """Route token verification through a stub that records each token it is asked about"""
+    calls = []
+    payloads = {}
+
+    def verify_token(token):
+        calls.append(token)
+        return dict(payloads[token])
+
+    monkeypatch.setattr(main.iam_service, "verify_token", verify_token)
+    monkeypatch.setattr(main, "_token_cache", TTLCache(maxsize=16, ttl=30))
+    return calls, payloads
+
+def test_verify_token_cached_reuses_the_payload_of_a_repeated_token(verify_calls):
+    calls, payloads = verify_calls
+    payloads["a"] = {"username": "alice", "role": "analyst", "exp": time.time() + 600}
+    payloads["b"] = {"username": "bob", "role": "admin", "exp": time.time() + 600}
+
+    assert main._verify_token_cached("a")["username"] == "alice"
+    assert main._verify_token_cached("a")["username"] == "alice"
+    assert main._verify_token_cached("b")["username"] == "bob"
+    assert calls == ["a", "b"]
+
+def test_verify_token_cached_verifies_again_once_the_token_expired(verify_calls):
+    calls, payloads = verify_calls
+    # Still inside the cache TTL, but past the token's own exp
+    payloads["a"] = {"username": "alice", "role": "analyst", "exp": time.time() - 1}
+
+    main._verify_token_cached("a")
+    main._verify_token_cached("a")
+    assert calls == ["a", "a"]
+
+def test_verify_token_cached_does_not_cache_failures(verify_calls, monkeypatch):
+    calls, _ = verify_calls
+
+    def reject(token):
+        calls.append(token)
+        raise Exception("[IAM Layer] Invalid token")
+
+    monkeypatch.setattr(main.iam_service, "verify_token", reject)
+    for _ in range(2):
+        with pytest.raises(Exception, match="Invalid token"):
+            main._verify_token_cached("bad")
+    assert calls == ["bad", "bad"]
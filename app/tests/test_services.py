@@ -0,0 +1,324 @@
+import orjson
+import pytest
+import time
+import trino
+from cachetools import TTLCache
+from app.config.settings import settings
+from app.services import iam_service, memory_service, schema_service, trino_service
+from app.services.ai_service import _direct_query, _extract_json, _validate_sql_query
+
+@pytest.mark.parametrize("reply, expected", [
+    ('["a", "b"]', ["a", "b"]),
+    ('Here are some questions:\n["What period?", "Which metric?"]\nHope this helps', ["What period?", "Which metric?"]),
+    ('```json\n{"user_type": "business"}\n```', {"user_type": "business"}),
+    ('Sure! {"note": "brackets ] and } inside strings", "n": [1, 2]} trailing', {"note": "brackets ] and } inside strings", "n": [1, 2]}),
+    ('{"quote": "escaped \\" quote ]"}', {"quote": 'escaped " quote ]'}),
+])
+def test_extract_json(reply, expected):
+    assert _extract_json(reply) == expected
+
+@pytest.mark.parametrize("reply", ["no json here", '["unterminated", "array"'])
+def test_extract_json_rejects_replies_without_a_complete_value(reply):
+    with pytest.raises(orjson.JSONDecodeError):
+        _extract_json(reply)
+
+@pytest.mark.parametrize("query", [
+    "SELECT a FROM t",
+    "select a from t where b = 1 group by a order by a",
+    "SELECT a FROM t LEFT JOIN u ON t.id = u.id",
+    # Clause keywords may be separated by any whitespace
+    "SELECT a FROM t LEFT  JOIN u ON t.id = u.id",
+    "SELECT a FROM t ORDER\nBY a",
+    "SELECT a FROM t -- trailing comment",
+])
+def test_validate_sql_query_accepts(query):
+    assert _validate_sql_query(query) == (True, "Query is valid")
+
+@pytest.mark.parametrize("query, message", [
+    ("SELECT a FROM t WHERE b = :b", "Invalid character ':' found in query"),
+    ("SELECT a FROM t; DROP TABLE t", "Invalid character ';' found in query"),
+    ("SELECT a FROM t /* hint */", "Invalid character '/*' found in query"),
+    ("WITH x AS (SELECT 1) SELECT * FROM x", "Query must start with SELECT"),
+    ("Selected customers from the east region", "Query must start with SELECT"),
+    ("SELECT 1", "Query must contain a FROM clause"),
+    ("SELECT a FROM t JOIN u ON t.id = u.id", "Invalid JOIN syntax"),
+    ("SELECT a FROM t WHERE", "WHERE clause cannot be empty"),
+    ("SELECT a FROM t GROUP BY ", "GROUP BY clause cannot be empty"),
+    # An empty clause is caught even when a newline splits its keywords
+    ("SELECT a FROM t ORDER\nBY", "ORDER BY clause cannot be empty"),
+])
+def test_validate_sql_query_rejects(query, message):
+    assert _validate_sql_query(query) == (False, message)
+
+SCHEMA_CONTEXT = "Catalog: hive\n  Schema: sales\n    Table: orders\n"
+
+@pytest.mark.parametrize("question", [
+    "SELECT * FROM orders;",
+    "select o.region, sum(o.total) as revenue from orders o group by o.region",
+    "SELECT CASE WHEN total > 100 THEN 'large order' ELSE 'small' END AS size, count(*) n FROM orders GROUP BY 1",
+    "show tables from hive.sales",
+])
+def test_direct_query_passes_statements_through(question):
+    assert _direct_query(question, SCHEMA_CONTEXT) == ("raw_sql", question.strip().rstrip(";"))
+
+@pytest.mark.parametrize("question", [
+    "Selected customers from the east region where revenue grew",
+    "Select the top customers from sales where revenue is high",
+    "show me revenue by month",
+    "Describe the sales trend for last quarter",
+])
+def test_direct_query_leaves_questions_that_look_like_sql_to_the_model(question):
+    assert _direct_query(question, SCHEMA_CONTEXT) is None
+
+def test_direct_query_answers_simple_questions_about_known_tables_from_templates():
+    assert _direct_query("how many orders?", SCHEMA_CONTEXT) == ("template", "SELECT COUNT(*) AS row_count FROM orders")
+    assert _direct_query("show all orders", SCHEMA_CONTEXT) == ("template", "SELECT * FROM orders LIMIT 100")
+    assert _direct_query("how many customers?", SCHEMA_CONTEXT) is None
+
+@pytest.fixture
+def iam(tmp_path):
+    service = iam_service.IAMService()
+    service.users_dir = tmp_path
+    assert service.create_user("alice", "correct-horse", role="analyst")
+    return service
+
+@pytest.fixture
+def checkpw_calls(monkeypatch):
+    """Record the passwords bcrypt is asked to check"""
+    calls = []
+    checkpw = iam_service.bcrypt.checkpw
+
+    def counting_checkpw(password, hashed_password):
+        calls.append(password)
+        return checkpw(password, hashed_password)
+
+    monkeypatch.setattr(iam_service.bcrypt, "checkpw", counting_checkpw)
+    return calls
+
+def test_authenticate_user_skips_bcrypt_for_a_password_that_just_failed(iam, checkpw_calls):
+    assert iam.authenticate_user("alice", "wrong-password") is None
+    assert iam.authenticate_user("alice", "wrong-password") is None
+    assert checkpw_calls == [b"wrong-password"]
+
+    # Only that password is remembered; the right one is still checked and accepted
+    assert iam.authenticate_user("alice", "correct-horse")["username"] == "alice"
+    assert checkpw_calls == [b"wrong-password", b"correct-horse"]
+
+def test_failed_logins_expire(iam, checkpw_calls):
+    now = [0.0]
+    iam._failed_logins = TTLCache(maxsize=16, ttl=30, timer=lambda: now[0])
+
+    iam.authenticate_user("alice", "wrong-password")
+    now[0] = 31.0
+    iam.authenticate_user("alice", "wrong-password")
+    assert checkpw_calls == [b"wrong-password", b"wrong-password"]
+
+def test_failed_logins_are_forgotten_when_the_password_changes(iam):
+    assert iam.authenticate_user("alice", "next-password") is None
+    assert iam.update_password("alice", "correct-horse", "next-password")
+    assert iam.authenticate_user("alice", "next-password")["username"] == "alice"
+
+SCHEMA = {
+    "catalogs": ["hive"],
+    "schemas": {"hive": ["sales"]},
+    "tables": {"hive.sales": ["orders"]},
+    "columns": {"hive.sales.orders": [{"name": "id", "type": "bigint", "extra": None, "comment": None}]}
+}
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    return tmp_path / "schema_cache.json"
+
+def _schema_service(snapshot_path):
+    """A SchemaService reading its snapshot from snapshot_path (no Trino calls are made)"""
+    service = schema_service.SchemaService(trino_service=None)
+    service._cache_path = snapshot_path
+    service.schema_cache, service.last_cache_update, service.schema_version = {}, 0, 0
+    service._load_persisted_schema()
+    return service
+
+def _write_snapshot(snapshot_path, schema=SCHEMA, age=0):
+    service = _schema_service(snapshot_path)
+    service.schema_cache = schema
+    service.last_cache_update = time.time() - age
+    service._persist_schema()
+
+def test_schema_snapshot_round_trips(snapshot_path):
+    _write_snapshot(snapshot_path)
+    service = _schema_service(snapshot_path)
+    assert service.schema_cache == SCHEMA
+    assert service.schema_version == 1
+    assert not service._is_hard_expired()
+
+def test_schema_snapshot_from_another_cluster_is_ignored(snapshot_path):
+    _write_snapshot(snapshot_path)
+    snapshot = orjson.loads(snapshot_path.read_bytes())
+    snapshot["fingerprint"] = ["other-host", 8080, "trino"]
+    snapshot_path.write_bytes(orjson.dumps(snapshot))
+    assert _schema_service(snapshot_path).schema_cache == {}
+
+def test_schema_snapshot_past_hard_expiry_is_ignored(snapshot_path):
+    _write_snapshot(snapshot_path, age=schema_service.SCHEMA_HARD_EXPIRY * settings.SCHEMA_CACHE_TTL + 60)
+    assert _schema_service(snapshot_path).schema_cache == {}
+
+@pytest.mark.parametrize("content", [b"", b"not json", b'{"fingerprint": []}', b"\x80\x04\x95 pickled"])
+def test_unreadable_schema_snapshot_is_ignored(snapshot_path, content):
+    snapshot_path.write_bytes(content)
+    assert _schema_service(snapshot_path).schema_cache == {}
+
+def test_missing_schema_snapshot_leaves_the_cache_empty(snapshot_path):
+    service = _schema_service(snapshot_path)
+    assert service.schema_cache == {}
+    assert service._is_hard_expired()
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Make the pool open FakeConnections, recording each one"""
+    opened = []
+
+    def connect():
+        opened.append(FakeConnection(len(opened)))
+        return opened[-1]
+
+    monkeypatch.setattr(trino_service, "_connect", connect)
+    return opened
+
+def _idle_connections(pool):
+    idle = []
+    while not pool._idle.empty():
+        idle.append(pool._idle.get_nowait())
+    for conn in idle:
+        pool._idle.put(conn)
+    return idle
+
+def test_pool_returns_borrowed_connections(connections):
+    pool = trino_service.TrinoPool(2)
+    with pool.acquire() as conn:
+        assert pool.stats()["idle"] == 1
+    assert conn in _idle_connections(pool)
+    assert pool.stats() == {"size": 2, "idle": 2, "created": 2, "discarded": 0}
+
+def test_pool_replaces_a_connection_the_server_dropped(connections):
+    pool = trino_service.TrinoPool(2)
+    with pytest.raises(trino.exceptions.TrinoConnectionError):
+        with pool.acquire() as conn:
+            raise trino.exceptions.TrinoConnectionError("connection reset")
+
+    assert conn.closed
+    idle = _idle_connections(pool)
+    assert conn not in idle and connections[2] in idle
+    assert pool.stats() == {"size": 2, "idle": 2, "created": 3, "discarded": 1}
+
+def test_pool_keeps_the_slot_when_a_replacement_cannot_be_opened(connections, monkeypatch):
+    pool = trino_service.TrinoPool(1)
+
+    def refuse():
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(trino_service, "_connect", refuse)
+    with pytest.raises(trino.exceptions.TrinoConnectionError):
+        with pool.acquire() as conn:
+            raise trino.exceptions.TrinoConnectionError("connection reset")
+    # The closed connection is not handed out again
+    assert _idle_connections(pool) == [None]
+    with pytest.raises(trino.exceptions.TrinoConnectionError):
+        with pool.acquire():
+            pass
+    assert _idle_connections(pool) == [None]
+
+    # Once the server is reachable again, the next borrow reconnects the slot
+    monkeypatch.setattr(trino_service, "_connect", lambda: FakeConnection("new"))
+    with pool.acquire() as conn:
+        assert conn.number == "new"
+    assert _idle_connections(pool) == [conn]
+
+def test_pool_acquire_times_out_when_every_connection_is_busy(connections):
+    pool = trino_service.TrinoPool(1)
+    with pool.acquire():
+        with pytest.raises(TimeoutError):
+            with pool.acquire(timeout=0.01):
+                pass
+    assert pool.stats()["idle"] == 1
+
+def test_pool_close_skips_empty_slots(connections):
+    pool = trino_service.TrinoPool(2)
+    pool._idle.get_nowait()
+    pool._idle.put(None)
+    pool.close()
+    assert connections[0].closed
+
+class FakeCollection:
+    """Records batched writes; queries return every stored conversation"""
+
+    def __init__(self):
+        self.add_calls = []
+        self.ids, self.documents, self.metadatas = [], [], []
+
+    def count(self):
+        return len(self.ids)
+
+    def add(self, documents, metadatas, ids):
+        self.add_calls.append(list(ids))
+        self.documents += documents
+        self.metadatas += metadatas
+        self.ids += ids
+
+    def query(self, query_embeddings, n_results, where):
+        return {
+            "ids": [self.ids[:n_results]],
+            "documents": [self.documents[:n_results]],
+            "metadatas": [self.metadatas[:n_results]]
+        }
+
+class FakeChromaClient:
+    def __init__(self, path, settings):
+        self.collections = {}
+
+    def get_or_create_collection(self, name, embedding_function, metadata):
+        return self.collections.setdefault(name, FakeCollection())
+
+@pytest.fixture
+def memory(monkeypatch):
+    monkeypatch.setattr(memory_service.chromadb, "PersistentClient", FakeChromaClient)
+    monkeypatch.setattr(memory_service, "DefaultEmbeddingFunction", lambda: lambda texts: [[0.0] for _ in texts])
+    service = memory_service.MemoryService()
+    # Keep the interval from triggering a flush unless a test asks for it
+    service._last_flush = time.monotonic() + 3600
+    return service
+
+def test_stored_conversations_are_queued_until_the_batch_is_full(memory):
+    for i in range(memory_service.FLUSH_THRESHOLD - 1):
+        memory.store_conversation(f"question {i}", f"answer {i}")
+    assert memory.collection.add_calls == []
+
+    memory.store_conversation("last question", "last answer")
+    assert len(memory.collection.add_calls) == 1
+    assert len(memory.collection.add_calls[0]) == memory_service.FLUSH_THRESHOLD
+    assert memory.memory_count == memory_service.FLUSH_THRESHOLD
+
+def test_stored_conversations_are_written_once_the_flush_interval_passed(memory):
+    memory._last_flush = time.monotonic() - memory_service.FLUSH_INTERVAL - 1
+    conversation_id = memory.store_conversation("question", "answer", {"type": "sql_generation"})
+    assert memory.collection.add_calls == [[conversation_id]]
+    assert orjson.loads(memory.collection.metadatas[0]["metadata"]) == {"type": "sql_generation"}
+
+def test_queued_conversations_are_flushed_before_searching(memory):
+    memory.store_conversation("question", "answer")
+    assert memory.collection.add_calls == []
+
+    memories = memory.get_relevant_memories("question")
+    assert len(memory.collection.add_calls) == 1
+    assert [(m["question"], m["response"]) for m in memories] == [("question", "answer")]
+
+def test_flush_without_pending_conversations_writes_nothing(memory):
+    memory.flush()
+    assert memory.collection.add_calls == []
+    assert memory.get_relevant_memories("question") == []